@@ -16,44 +16,100 @@ from importlib import resources  # Python 3.7+
 import sys
 import logging
 import argparse
+import json
 
-from threading import Thread, Event
+from threading import Thread
 
-from row_estimator_for_apache_cassandra.estimator import Estimator
+from row_estimator_for_apache_cassandra.stats import StreamingStats, PartitionStats
+from row_estimator_for_apache_cassandra.results import make_result, write_result, read_result, merge_results
+from row_estimator_for_apache_cassandra.metrics import MetricsReporter, ThreadProfiler
 
-def main():
-    def add_helper(n):
-        return columns_in_bytes+n
+# Amazon Keyspaces serves up to 1,000 write capacity units per second on a single partition
+PARTITION_WRITE_UNITS_PER_SEC = 1000
 
+def main():
     logging.getLogger('cassandra').setLevel(logging.ERROR)
     logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
 
-    # Event object used to send signals from one thread to another
-    stop_event = Event()
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        merge_main(sys.argv[2:])
+        return
 
     # Configure app args
     parser = argparse.ArgumentParser(description='The tool helps to gather Cassandra rows stats')
     requiredNamed = parser.add_argument_group('required named arguments')
-    requiredNamed.add_argument('--hostname', help='Cassandra endpoint', default='127.0.0.1', required=True)
-    requiredNamed.add_argument('--port', help='Cassandra native transport port', required=True)
+    requiredNamed.add_argument('--hostname', help='Cassandra endpoint, required unless exported files are read', default='127.0.0.1')
+    requiredNamed.add_argument('--port', help='Cassandra native transport port, required unless exported files are read')
     parser.add_argument('--ssl', help='Use SSL.', default=None)
     parser.add_argument('--path-cert', help='Path to the TLS certificate', default=None)
     parser.add_argument('--username', help='Authenticate as user')
     parser.add_argument('--password',help='Authenticate using password')
-    requiredNamed.add_argument('--keyspace',help='Gather stats against provided keyspace', required=True)
-    requiredNamed.add_argument('--table',help='Gather stats against provided table', required=True)
+    requiredNamed.add_argument('--keyspace',help='Gather stats against provided keyspace, required unless --keyspaces is used')
+    requiredNamed.add_argument('--table',help='Gather stats against provided table, required unless --keyspaces is used')
+    parser.add_argument('--keyspaces', help='Gather stats against every table of these comma separated keyspaces', default=None)
+    parser.add_argument('--table-workers', help='How many tables to sample at the same time with --keyspaces', type=int, default=4)
+    parser.add_argument('--output', help='Write a JSON summary per table to this file with --keyspaces', default=None)
     parser.add_argument('--execution-timeout', help='Set execution timeout in seconds', type=int, default=360)
     parser.add_argument('--token-step', help='Set token step, for example, 2, 4, 8, 16, 32, ..., 255',type=int, default=4)
     parser.add_argument('--rows-per-request', help='How many rows per token',type=int, default=1000)
     parser.add_argument('--pagination', help='Turn on pagination mechanism',type=int, default=200)
     parser.add_argument('--dc', help='Define Cassandra datacenter for routing policy', default='datacenter1')
     parser.add_argument('--json', help='Estimata size of Cassandra rows as JSON', default=None)
+    parser.add_argument('--concurrency', help='How many token ranges to read in parallel', type=int, default=1)
+    parser.add_argument('--wire-sizes', help='Measure cells by their serialized length without decoding them', action='store_true')
+    parser.add_argument('--routing', help='coordinator: let the driver pick a coordinator, replica: send each range to a local replica',
+                        choices=['coordinator', 'replica'], default='coordinator')
+    parser.add_argument('--max-in-flight-per-host', help='Token ranges in flight per host with --routing replica', type=int, default=2)
+    parser.add_argument('--sampling', help='ring: every token step-th range of the token ring, stratified: up to rows per request rows from a random token of each of equal strata of the whole ring, '
+                        'weighted: the row budget of ring sampling spread over the ranges of system.size_estimates by their share of the data',
+                        choices=['ring', 'stratified', 'weighted'], default='ring')
+    parser.add_argument('--strata', help='Number of strata with --sampling stratified, defaults to the number of ring ranges divided by the token step', type=int, default=None)
+    parser.add_argument('--target-relative-error', help='Sample ranges in random order until the mean and P50/P90/P99 are known to this relative error, for example 0.02', type=float, default=None)
+    parser.add_argument('--confidence', help='Confidence level of --target-relative-error', type=float, default=0.95)
+    parser.add_argument('--seed', help='Seed of the random range order', type=int, default=None)
+    parser.add_argument('--checkpoint-file', help='Save progress to this SQLite file and resume from it when it exists', default=None)
+    parser.add_argument('--checkpoint-interval', help='Seconds between checkpoints', type=int, default=30)
+    parser.add_argument('--per-column-sizes', help='Report average bytes per column, requires --wire-sizes', action='store_true')
+    parser.add_argument('--shard', help='Read only shard K of N disjoint slices of the token ranges, for example 3/8', type=parse_shard, default=None)
+    parser.add_argument('--max-p99-ms', help='Adapt the number of ranges in flight, up to --concurrency, to keep the P99 query latency under this many milliseconds', type=float, default=None)
+    parser.add_argument('--max-rows-per-sec', help='Never read more rows per second than this', type=float, default=None)
+    parser.add_argument('--max-retries', help='Retries of a page that timed out or hit an overloaded node', type=int, default=3)
+    parser.add_argument('--full-metadata', help='Let the driver download the schema of every keyspace on connect', action='store_true')
+    parser.add_argument('--from-csv', help='Estimate from these COPY TO CSV files instead of a cluster', nargs='+', default=None)
+    parser.add_argument('--from-sstabledump', help='Estimate from these sstabledump JSON files instead of a cluster', nargs='+', default=None)
+    parser.add_argument('--csv-header', help='The CSV files start with a header line, as written by COPY TO ... WITH HEADER = true', action='store_true')
+    parser.add_argument('--column-types', help='Columns of exported files in table order (partition key, clustering, regular), for example "id:int,tags:set<text>"', default=None)
+    parser.add_argument('--workers', help='Processes that parse exported files, defaults to the number of CPUs', type=int, default=None)
+    parser.add_argument('--chunk-size-mb', help='Exported files are parsed in chunks of this many MB', type=int, default=64)
+    parser.add_argument('--result-file', help='Write the statistics to this file, shards are combined with the merge command', default=None)
+    parser.add_argument('--partitions', help='Group sampled rows by partition, report rows and bytes per partition and the largest partitions', action='store_true')
+    parser.add_argument('--top-partitions', help='How many of the largest partitions to report with --partitions', type=int, default=10)
+    parser.add_argument('--wide-partition-rows', help='With --partitions, a partition cut by the rows per request limit after this many rows is read to the end by a follow-up query', type=int, default=100)
+    parser.add_argument('--max-partition-rows', help='Rows read at most from one partition by a follow-up query', type=int, default=100000)
+    parser.add_argument('--progress-interval', help='Seconds between progress lines and metrics file updates, 0 turns them off', type=float, default=30)
+    parser.add_argument('--metrics-file', help='Write query counters and latency histograms to this file during and after the run', default=None)
+    parser.add_argument('--metrics-format', help='Format of --metrics-file, prometheus suits the node_exporter textfile collector',
+                        choices=['json', 'prometheus'], default='json')
+    parser.add_argument('--profile', help='Run under cProfile, including the driver threads, print the busiest functions and save the stats to this file', default=None)
     
     if (len(sys.argv)<2):
         parser.print_help()
         sys.exit()
 
     args = parser.parse_args()
+    if args.from_csv or args.from_sstabledump:
+        estimate_exported_files(args)
+        return
+    if not args.port:
+        parser.error('--port is required unless --from-csv or --from-sstabledump is used')
+    if not args.keyspaces and not (args.keyspace and args.table):
+        parser.error('--keyspace and --table are required unless --keyspaces is used')
+    if args.partitions and (args.wire_sizes or args.json is not None):
+        parser.error('--partitions needs the key of every row, it does not work with --wire-sizes or --json')
+    if args.shard and args.sampling == 'weighted':
+        parser.error('--shard does not work with --sampling weighted, each worker would plan from different size estimates')
+    if args.checkpoint_file and args.sampling == 'weighted':
+        parser.error('--checkpoint-file does not work with --sampling weighted, a resumed run would plan from different size estimates')
     p_hostname = args.hostname
     p_port = args.port
     p_username = args.username
@@ -68,67 +124,256 @@ def main():
     p_token_step = args.token_step
     p_rows_per_request = args.rows_per_request
     p_pagination = args.pagination  
+    p_concurrency = args.concurrency
+    p_wire_sizes = args.wire_sizes
+    p_per_column_sizes = args.per_column_sizes
+    p_routing = args.routing
+    p_max_in_flight_per_host = args.max_in_flight_per_host
+    p_target_relative_error = args.target_relative_error
+    p_confidence = args.confidence
+    p_seed = args.seed
+    p_sampling = args.sampling
+    p_strata = args.strata
+    p_checkpoint_file = args.checkpoint_file
+    p_checkpoint_interval = args.checkpoint_interval
+    p_shard = args.shard
+    p_max_p99_ms = args.max_p99_ms
+    p_max_rows_per_sec = args.max_rows_per_sec
+    p_max_retries = args.max_retries
+    p_fast_connect = not args.full_metadata
+    p_partitions = args.partitions
+    p_top_partitions = args.top_partitions
+    p_wide_partition_rows = args.wide_partition_rows
+    p_max_partition_rows = args.max_partition_rows
+
+    # The driver is imported only now, so --help and argument errors return at once
+    from row_estimator_for_apache_cassandra.estimator import Estimator
     
     estimator = Estimator(p_hostname, p_port, p_username, p_password, p_ssl, p_dc, p_keyspace, p_table,
-                          p_execution_timeout, p_token_step, p_rows_per_request, p_pagination, p_path_cert)
+                          p_execution_timeout, p_token_step, p_rows_per_request, p_pagination, p_path_cert,
+                          p_concurrency, p_wire_sizes, p_per_column_sizes, p_routing, p_max_in_flight_per_host,
+                          p_target_relative_error, p_confidence, p_seed, p_sampling, p_strata,
+                          p_checkpoint_file, p_checkpoint_interval, p_shard, p_max_p99_ms, p_max_rows_per_sec,
+                          p_max_retries, p_fast_connect, p_partitions, p_top_partitions, p_wide_partition_rows,
+                          p_max_partition_rows)
 
     logging.info("Endpoint: %s %s", p_hostname, p_port)
+    profiler = None
+    if args.profile:
+        # Started before the driver connects, so its event loop thread is profiled too
+        profiler = ThreadProfiler()
+        profiler.start()
+    reporter = MetricsReporter(estimator.metrics, args.progress_interval, args.metrics_file, args.metrics_format)
+    reporter.start()
+    try:
+        if args.keyspaces:
+            estimate_keyspaces(estimator, args.keyspaces.split(','), p_json is not None, args.table_workers, args.output)
+        else:
+            estimate_table(estimator, p_json is not None, args.result_file)
+    finally:
+        reporter.stop()
+        if args.metrics_file:
+            logging.info("Metrics written to %s", args.metrics_file)
+        log_metrics(estimator.metrics)
+        if profiler is not None:
+            profiler.stop(args.profile)
+            logging.info("Profile written to %s", args.profile)
+
+def estimate_table(estimator, as_json, result_file):
+    """ Samples the table of the estimator and logs the report """
     logging.info("Keyspace name: %s", estimator.keyspace)
     logging.info("Table name: %s", estimator.table)
     logging.info("Client SSL: %s", estimator.ssl)
+    logging.info("Sampling: %s", estimator.sampling)
+    if estimator.shard:
+        logging.info("Shard: %s of %s", *estimator.shard)
     logging.info("Token step: %s", estimator.token_step)
     logging.info("Limit of rows per token step: %s", estimator.rows_per_request)
     logging.info("Pagination: %s", estimator.pagination)
+    logging.info("Concurrency: %s", estimator.concurrency)
+    logging.info("Wire sizes: %s", estimator.wire_sizes)
+    logging.info("Routing: %s", estimator.routing)
+    if estimator.max_p99_ms:
+        logging.info("Target P99 latency: %s ms", estimator.max_p99_ms)
+    if estimator.max_rows_per_sec:
+        logging.info("Max rows per second: %s", estimator.max_rows_per_sec)
+    if estimator.aggregate_partitions:
+        logging.info("Partition aggregation: top %s, follow-up after %s rows", estimator.top_partitions, estimator.wide_partition_rows)
     logging.info("Execution-timeout: %s", estimator.execution_timeout)
 
-    if p_json == None:
-        action_thread = Thread(target=estimator.row_sampler(json=False))
-        action_thread.start()
-        action_thread.join(timeout=estimator.execution_timeout)
-        stop_event.set()
-
-        columns_in_bytes = estimator.get_total_column_size()
-
-        rows_in_bytes = estimator.rows_in_bytes
-        rows_columns_in_bytes = map(add_helper, rows_in_bytes)
-        val = list(rows_columns_in_bytes)
-        logging.info("Number of sampled rows: %s", len(rows_in_bytes))
-        logging.info("Estimated size of column names and values in a row:")
-        logging.info("	Mean: %s", '{:06.2f}'.format(estimator.mean(val)))
-        logging.info("	Weighted_mean: %s", '{:06.2f}'.format(estimator.weighted_mean(val)))
-        logging.info("	Median: %s", '{:06.2f}'.format(estimator.median(val)))
-        logging.info("	Min: %s",min(val))
-        logging.info("	P10: %s",'{:06.2f}'.format(estimator.quartiles(val, 0.1)))
-        logging.info("	P50: %s",'{:06.2f}'.format(estimator.quartiles(val, 0.5)))
-        logging.info("	P90: %s",'{:06.2f}'.format(estimator.quartiles(val, 0.9)))
-        logging.info("	Max: %s",max(val))
-        logging.info("	Average: %s",'{:06.2f}'.format(sum(val)/len(val)))
-        logging.info("Estimated size of values in a row")
-        logging.info("	Mean: %s", '{:06.2f}'.format(estimator.mean(rows_in_bytes)))
-        logging.info("	Weighted_mean: %s", '{:06.2f}'.format(estimator.weighted_mean(rows_in_bytes)))
-        logging.info("	Median: %s", '{:06.2f}'.format(estimator.median(rows_in_bytes)))
-        logging.info("	Min: %s",min(rows_in_bytes))
-        logging.info("	P10: %s",'{:06.2f}'.format(estimator.quartiles(rows_in_bytes, 0.1)))
-        logging.info("	P50: %s",'{:06.2f}'.format(estimator.quartiles(rows_in_bytes, 0.5)))
-        logging.info("	P90: %s",'{:06.2f}'.format(estimator.quartiles(rows_in_bytes, 0.9)))
-        logging.info("	Max: %s",max(rows_in_bytes))
-        logging.info("	Average: %s",'{:06.2f}'.format(sum(rows_in_bytes)/len(rows_in_bytes)))
+    # row_sampler enforces execution_timeout itself, the join timeout is a last resort
+    action_thread = Thread(target=estimator.row_sampler, kwargs={'json': as_json}, daemon=True)
+    action_thread.start()
+    try:
+        action_thread.join(timeout=estimator.execution_timeout+30 if estimator.execution_timeout else None)
+    except KeyboardInterrupt:
+        logging.warning("Interrupted, stopping the sampler")
+    if action_thread.is_alive():
+        # Cancelling also saves the checkpoint, if any
+        estimator.cancel()
+        action_thread.join(timeout=30)
+
+    logging.info("Token ranges sampled: %s of %s", estimator.ranges_completed, estimator.ranges_total)
+    if estimator.size_projection:
+        logging.info("Partitions in the table according to size_estimates: %s", estimator.size_projection['partitions'])
+        logging.info("Table size on disk according to size_estimates: %s bytes", estimator.size_projection['bytes'])
+    if estimator.timed_out:
+        logging.warning("Execution timeout reached, statistics are partial")
+    if estimator.relative_errors is not None:
+        logging.info("Relative error at %s confidence:", estimator.confidence)
+        for name, error in estimator.relative_errors.items():
+            logging.info("\t%s: %s", name if name == 'mean' else 'P%d' % round(name*100), '{:.4f}'.format(error))
+
+    result = make_result(estimator, as_json)
+    if result_file:
+        write_result(result_file, result)
+        logging.info("Result written to %s", result_file)
+    log_report(result)
+    estimator.close()
+
+def estimate_keyspaces(estimator, keyspaces, as_json, table_workers, output):
+    """ Samples every table of the keyspaces over one session and logs or writes a summary per table """
+    tables = estimator.get_tables(keyspaces)
+    logging.info("Tables to sample: %s", len(tables))
+    out = open(output, 'w') if output else None
+    try:
+        for summary in estimator.estimate_tables(tables, json=as_json, table_workers=table_workers):
+            if out:
+                out.write(json.dumps(summary)+'\n')
+                out.flush()
+            logging.info("%s.%s: %s rows, mean %s, P90 %s, max %s, %s of %s token ranges",
+                         summary['keyspace'], summary['table'], summary['rows'],
+                         '{:06.2f}'.format(summary.get('mean', 0)), summary.get('p90'), summary.get('max'),
+                         summary['ranges_completed'], summary['ranges_total'])
+            if summary.get('partitions'):
+                largest = summary['partitions']['largest'][:1]
+                logging.info("%s.%s: %s partitions, P99 %s rows, largest %s", summary['keyspace'], summary['table'],
+                             summary['partitions']['count'], summary['partitions']['rows_p99'],
+                             '%s (%s rows, %s bytes)' % (largest[0]['key'], largest[0]['rows'], largest[0]['bytes']) if largest else None)
+    finally:
+        if out:
+            out.close()
+        estimator.close()
+
+def merge_main(argv):
+    """ The merge command: combines the result files of shards into one report """
+    parser = argparse.ArgumentParser(prog='row_estimator_for_apache_cassandra merge',
+                                     description='Combine result files written with --shard and --result-file')
+    parser.add_argument('files', help='Result files to combine', nargs='+')
+    parser.add_argument('--output', help='Write the combined result to this file', default=None)
+    args = parser.parse_args(argv)
+
+    result = merge_results([read_result(f) for f in args.files])
+    logging.info("Keyspace name: %s", result['keyspace'])
+    logging.info("Table name: %s", result['table'])
+    logging.info("Shards: %s", ', '.join('%s/%s' % tuple(s) for s in result['shards']))
+    logging.info("Token ranges sampled: %s of %s", result['ranges_completed'], result['ranges_total'])
+    if result['failed_ranges']:
+        logging.warning("Failed to read %s token ranges", len(result['failed_ranges']))
+    if args.output:
+        write_result(args.output, result)
+        logging.info("Result written to %s", args.output)
+    log_report(result)
+
+def estimate_exported_files(args):
+    """ Offline mode: measures the rows of exported files, no cluster is contacted """
+    from row_estimator_for_apache_cassandra.offline import estimate_files, parse_column_types, CHUNK_SIZE
+
+    file_format = 'csv' if args.from_csv else 'sstabledump'
+    paths = args.from_csv or args.from_sstabledump
+    column_types = parse_column_types(args.column_types) if args.column_types else None
+    logging.info("Files: %s", ', '.join(paths))
+    logging.info("Format: %s", file_format)
+    if not column_types:
+        logging.info("No --column-types, values are measured by their text length")
+    result = estimate_files(paths, file_format, column_types, args.csv_header, args.workers,
+                            args.chunk_size_mb * 1024 * 1024 if args.chunk_size_mb else CHUNK_SIZE,
+                            args.keyspace, args.table)
+    if args.result_file:
+        write_result(args.result_file, result)
+        logging.info("Result written to %s", args.result_file)
+    log_report(result)
+
+def parse_shard(value):
+    """ Parses K/N into (k, n) """
+    try:
+        k, n = [int(v) for v in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard must look like K/N, for example 3/8")
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError("shard K/N needs 1 <= K <= N")
+    return (k, n)
+
+def log_report(result):
+    """ Logs the row size statistics of a result, see results.make_result """
+    row_stats = StreamingStats.from_dict(result['row_stats'])
+    logging.info("Number of sampled rows: %s", row_stats.count)
+    if not result['json']:
+        columns_in_bytes = result['column_names_bytes']
+        if row_stats.count:
+            logging.info("Estimated size of column names and values in a row:")
+            log_stats(row_stats, offset=columns_in_bytes, indent='\t')
+            logging.info("Estimated size of values in a row")
+            log_stats(row_stats, indent='\t')
         logging.info("Total column name size in a row: %s",columns_in_bytes)
-        logging.info("Columns in a row: %s", estimator.get_columns().count(',')+1)
-    else:
-        action_thread = Thread(target=estimator.row_sampler(json=True))
-        action_thread.start()
-        action_thread.join(timeout=estimator.execution_timeout)
-        stop_event.set()
-        rows_in_bytes = estimator.rows_in_bytes
-        logging.info("Number of sampled rows: %s", len(rows_in_bytes))
+        logging.info("Columns in a row: %s", len(result['columns']))
+        if result['column_totals'] is not None and row_stats.count:
+            logging.info("Average size of values per column:")
+            for column_name, column_total in zip(result['columns'], result['column_totals']):
+                logging.info("\t%s: %s", column_name, '{:06.2f}'.format(column_total/row_stats.count))
+    elif row_stats.count:
         logging.info("Estimated size of a Cassandra JSON row")
-        logging.info("Mean: %s", '{:06.2f}'.format(estimator.mean(rows_in_bytes)))
-        logging.info("Weighted_mean: %s", '{:06.2f}'.format(estimator.weighted_mean(rows_in_bytes)))
-        logging.info("Median: %s", '{:06.2f}'.format(estimator.median(rows_in_bytes)))
-        logging.info("Min: %s",min(rows_in_bytes))
-        logging.info("Max: %s",max(rows_in_bytes))
-        logging.info("Average: %s",'{:06.2f}'.format(sum(rows_in_bytes)/len(rows_in_bytes)))
+        log_stats(row_stats)
+    if result.get('partition_stats'):
+        log_partitions(PartitionStats.from_dict(result['partition_stats']))
+
+def log_partitions(partitions):
+    """ Logs rows and bytes per partition and the largest partitions, see stats.PartitionStats """
+    logging.info("Partitions sampled: %s, not read to the end: %s", partitions.count, partitions.truncated)
+    if not partitions.count:
+        return
+    for name, stats in (('Rows', partitions.rows), ('Bytes', partitions.bytes)):
+        logging.info("%s per partition: P50 %s, P90 %s, P99 %s, Max %s", name, '{:.0f}'.format(stats.quantile(0.5)),
+                     '{:.0f}'.format(stats.quantile(0.9)), '{:.0f}'.format(stats.quantile(0.99)), stats.max)
+    logging.info("Largest partitions (write units at %s per second and partition):", PARTITION_WRITE_UNITS_PER_SEC)
+    for p in partitions.largest():
+        logging.info("\t%s: %s rows, %s bytes, %s write units, %s s to write%s", p['key'], p['rows'], p['bytes'],
+                     p['write_units'], '{:.2f}'.format(p['write_units'] / float(PARTITION_WRITE_UNITS_PER_SEC)),
+                     ' (at least, not read to the end)' if p['truncated'] else '')
+
+def log_metrics(metrics):
+    """ Logs the query counters, latencies and time split of a run, see metrics.SamplerMetrics """
+    m = metrics.to_dict()
+    if not m['pages']:
+        return
+    page = m['page_latency_seconds']
+    split = m['time_split_seconds']
+    logging.info("Pages fetched: %s, retries: %s, timeouts: %s, overloaded: %s",
+                 m['pages'], m['retries'], m['timeouts'], m['overloaded'])
+    logging.info("Throughput: %s rows/s, %s bytes/s", '{:.0f}'.format(m['rows_per_sec']), '{:.0f}'.format(m['bytes_per_sec']))
+    logging.info("Page latency: P50 %s ms, P99 %s ms, max %s ms", '{:.1f}'.format(page['p50'] * 1000),
+                 '{:.1f}'.format(page['p99'] * 1000), '{:.1f}'.format(page['max'] * 1000))
+    logging.info("Seconds waiting for the driver: %s, decoding: %s, computing sizes: %s, CPU: %s",
+                 '{:.2f}'.format(split['driver_wait']), '{:.2f}'.format(split['decode']),
+                 '{:.2f}'.format(split['sizing']), '{:.2f}'.format(m['cpu_seconds']))
+    if m['slowest_ranges']:
+        logging.info("Slowest token ranges:")
+        for r in m['slowest_ranges']:
+            logging.info("\t(%s, %s]: %s s", r['token_range'][0], r['token_range'][1], '{:.2f}'.format(r['seconds']))
+
+def log_stats(stats, offset=0, indent=''):
+    """ Logs StreamingStats of row sizes, offset is added to every size (e.g. the column names) """
+    logging.info("%sMean: %s", indent, '{:06.2f}'.format(stats.mean+offset))
+    logging.info("%sWeighted_mean: %s", indent, '{:06.2f}'.format(stats.weighted_mean+offset))
+    logging.info("%sMedian: %s", indent, '{:06.2f}'.format(stats.quantile(0.5)+offset))
+    logging.info("%sMin: %s", indent, stats.min+offset)
+    logging.info("%sP10: %s", indent, '{:06.2f}'.format(stats.quantile(0.1)+offset))
+    logging.info("%sP50: %s", indent, '{:06.2f}'.format(stats.quantile(0.5)+offset))
+    logging.info("%sP90: %s", indent, '{:06.2f}'.format(stats.quantile(0.9)+offset))
+    logging.info("%sP99: %s", indent, '{:06.2f}'.format(stats.quantile(0.99)+offset))
+    logging.info("%sMax: %s", indent, stats.max+offset)
+    logging.info("%sStddev: %s", indent, '{:06.2f}'.format(stats.stddev))
+    logging.info("%sAverage: %s", indent, '{:06.2f}'.format(stats.total/stats.count+offset))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,235 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" asyncio interface of the estimator, for services that run many estimations in one process """
+
+import asyncio
+import logging
+from collections import deque, namedtuple
+
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+
+from row_estimator_for_apache_cassandra.estimator import Estimator, OVERLOAD_ERRORS
+from row_estimator_for_apache_cassandra.stats import StreamingStats, ConvergenceMonitor
+
+# Row sizes of one page of a token range, range_done is true for the last page of the range
+SizeBatch = namedtuple('SizeBatch', ['token_range', 'sizes', 'range_done'])
+
+# Settings of Estimator.row_sampler that AsyncEstimator does not implement, with their defaults
+ROW_SAMPLER_ONLY = {'aggregate_partitions': False, 'max_p99_ms': None, 'routing': 'coordinator',
+                    'checkpoint_file': None, 'per_column': False}
+
+
+class AsyncEstimator(object):
+    """
+        Coroutine front end of Estimator. Every estimate call has its own state and is cancelled
+        by cancelling its task; all calls share the session of one Estimator holding the settings.
+        max_in_flight bounds the token ranges in flight across all calls, each call also keeps
+        to the concurrency setting. max_rows_per_sec is shared by all calls and pages that time
+        out are retried up to max_retries times, as in Estimator.row_sampler.
+    """
+    def __init__(self, endpoint_name, port, max_in_flight=None, **settings):
+        unsupported = sorted(k for k, default in ROW_SAMPLER_ONLY.items() if settings.get(k, default) != default)
+        if unsupported:
+            raise ValueError("Only available with Estimator.row_sampler: %s" % ', '.join(unsupported))
+        self.estimator = Estimator(endpoint_name, port, **settings)
+        self.estimator._setup_load_control()
+        self.max_in_flight = max_in_flight
+        self._slots = None
+
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def connect(self):
+        """ Connects the shared session, estimate connects on first use as well """
+        await self._run_blocking(self.estimator.get_connection)
+
+    async def close(self):
+        await self._run_blocking(self.estimator.close)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def table(self, keyspace, table):
+        """ Returns an Estimator of the table sharing the session, it holds the state of one estimation """
+        return await self._run_blocking(self.estimator.for_table, keyspace, table)
+
+    def _plan(self, estimation, json):
+        session = estimation.get_sizing_session() if estimation.wire_sizes else estimation.get_connection()
+        statement = estimation.prepare_range_query(session, json)
+        return session, statement, estimation.get_sample_ranges(), estimation.get_row_sizer(json)
+
+    async def iter_pages(self, keyspace, table, json=False, estimation=None):
+        """
+            Async iterator of SizeBatch, one per page as it arrives. Failed ranges, the number of
+            ranges and the stop reason are kept in estimation (see table), execution_timeout ends
+            the iteration early with stop_reason 'timeout'.
+        """
+        if estimation is None:
+            estimation = await self.table(keyspace, table)
+        loop = asyncio.get_running_loop()
+        session, statement, token_ranges, row_size = await self._run_blocking(self._plan, estimation, json)
+        execution_profile = 'sizes' if estimation.wire_sizes else EXEC_PROFILE_DEFAULT
+        if self.max_in_flight and self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        slots = self._slots
+        limiter = estimation._rate_limiter
+        estimation.ranges_total = len(token_ranges)
+        deadline = loop.time() + estimation.execution_timeout if estimation.execution_timeout else None
+
+        pages = asyncio.Queue()
+        pending = deque(token_ranges)
+        # ResponseFuture -> token range, for the pages in flight
+        active = {}
+        # Token range -> [paging state of the page being read, retries], for the ranges being read
+        reading = {}
+        # Token range -> timer handle, for the ranges waiting to retry a page
+        retrying = {}
+
+        def deliver(future, rows, exc):
+            try:
+                loop.call_soon_threadsafe(pages.put_nowait, (future, rows, exc))
+            except RuntimeError:
+                # The event loop was closed while a page was in flight
+                pass
+
+        def start(token_range, paging_state=None):
+            retrying.pop(token_range, None)
+            limit = estimation.range_limits.get(token_range, estimation.rows_per_request)
+            future = session.execute_async(statement, [token_range[0], token_range[1], limit],
+                                           execution_profile=execution_profile, paging_state=paging_state)
+            active[future] = token_range
+            future.add_callbacks(callback=lambda rows: deliver(future, rows, None),
+                                 errback=lambda exc: deliver(future, None, exc))
+
+        def finish(token_range):
+            del reading[token_range]
+            if slots is not None:
+                slots.release()
+
+        try:
+            while pending or reading:
+                while pending and len(reading) < max(1, int(estimation.concurrency)):
+                    if slots is not None:
+                        # Waiting for a slot while holding some would starve the other estimations
+                        if reading and slots.locked():
+                            break
+                        await slots.acquire()
+                    token_range = pending.popleft()
+                    reading[token_range] = [None, 0]
+                    await _wait_for_rows(limiter)
+                    start(token_range)
+                timeout = None if deadline is None else deadline - loop.time()
+                try:
+                    if timeout is not None and timeout <= 0:
+                        raise asyncio.TimeoutError()
+                    future, rows, exc = await asyncio.wait_for(pages.get(), timeout)
+                except asyncio.TimeoutError:
+                    estimation.stop_reason = 'timeout'
+                    estimation.timed_out = True
+                    logging.warning("Sampling %s.%s stopped (timeout) with %s token ranges in flight",
+                                    estimation.keyspace, estimation.table, len(reading))
+                    return
+                if future not in active:
+                    continue
+                token_range = active.pop(future)
+                if exc is not None:
+                    state = reading[token_range]
+                    if isinstance(exc, OVERLOAD_ERRORS) and state[1] < estimation.max_retries:
+                        state[1] += 1
+                        delay = 0.1 * 2 ** state[1]
+                        logging.debug("Retrying token range %s in %ss: %s", token_range, delay, exc)
+                        retrying[token_range] = loop.call_later(delay, start, token_range, state[0])
+                        continue
+                    logging.warning("Token range %s failed: %s", token_range, exc)
+                    estimation.failed_ranges.append(token_range)
+                    finish(token_range)
+                    continue
+                if limiter is not None:
+                    limiter.consume(len(rows))
+                done = not future.has_more_pages
+                if done:
+                    finish(token_range)
+                else:
+                    # ResponseFuture has no public accessor for the paging state of the last page
+                    reading[token_range][0] = future._paging_state
+                    await _wait_for_rows(limiter)
+                    # The next page is on its way while the consumer handles this one
+                    future.start_fetching_next_page()
+                    active[future] = token_range
+                yield SizeBatch(token_range, [row_size(row) for row in rows], done)
+        finally:
+            # Cancelled, timed out or closed by the consumer: abandon the ranges still in flight
+            for handle in retrying.values():
+                handle.cancel()
+            for future in list(active):
+                future.clear_callbacks()
+            for token_range in list(reading):
+                finish(token_range)
+
+    async def estimate(self, keyspace, table, json=False):
+        """
+            Samples a table and returns its summary, see Estimator.summary. With
+            target_relative_error the estimation stops once the estimates converge.
+        """
+        estimation = await self.table(keyspace, table)
+        stats = StreamingStats()
+        monitor = None
+        if estimation.target_relative_error:
+            monitor = ConvergenceMonitor(estimation.target_relative_error, estimation.confidence)
+        # Rows and bytes of the ranges being read, for the convergence monitor
+        ranges = {}
+        pages = self.iter_pages(keyspace, table, json, estimation)
+        try:
+            async for batch in pages:
+                count, total = ranges.get(batch.token_range, (0, 0))
+                for size in batch.sizes:
+                    stats.add(size)
+                ranges[batch.token_range] = (count + len(batch.sizes), total + sum(batch.sizes))
+                if batch.range_done:
+                    estimation.ranges_completed += 1
+                    estimation.completed_ranges.append(batch.token_range)
+                    count, total = ranges.pop(batch.token_range)
+                    if monitor is not None:
+                        monitor.add_range(count, total)
+                        if monitor.converged(stats):
+                            estimation.stop_reason = 'converged'
+                            break
+        finally:
+            await pages.aclose()
+            estimation.row_stats = stats
+            if monitor is not None:
+                estimation.relative_errors = monitor.relative_errors(stats)
+        return estimation.summary()
+
+    async def estimate_many(self, tables, json=False):
+        """ Estimates (keyspace, table) pairs concurrently, returns their summaries in the same order """
+        async def one(keyspace, table):
+            try:
+                return await self.estimate(keyspace, table, json)
+            except Exception as exc:
+                logging.warning("Sampling %s.%s failed: %s", keyspace, table, exc)
+                return {'keyspace': keyspace, 'table': table, 'error': str(exc)}
+        return await asyncio.gather(*[one(keyspace, table) for keyspace, table in tables])
+
+
+async def _wait_for_rows(limiter):
+    """ Waits until the rows of earlier pages are paid for, see RateLimiter """
+    delay = limiter.delay() if limiter is not None else 0
+    if delay:
+        await asyncio.sleep(delay)
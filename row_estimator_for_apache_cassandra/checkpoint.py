@@ -0,0 +1,77 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" On-disk progress of a sampling run, so an interrupted run can be resumed """
+
+import json
+import sqlite3
+from threading import Lock
+
+
+class Checkpoint(object):
+    """
+        SQLite file holding the token ranges read so far and the statistics of their rows.
+        plan is a dict of the settings that decide which ranges are read, a checkpoint is
+        only resumed by a run with the same plan.
+    """
+    def __init__(self, path, plan):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ranges (start INTEGER, end INTEGER, PRIMARY KEY (start, end))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (id INTEGER PRIMARY KEY CHECK (id = 0), value TEXT)")
+        stored = self._get_meta('plan')
+        if stored is None:
+            self._set_meta('plan', plan)
+        elif stored != json.loads(json.dumps(plan)):
+            raise ValueError("Checkpoint file %s was written by a run with different settings: %s" % (path, stored))
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_meta(self, key, value):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def seed(self, default):
+        """ Returns the random seed of the run, stored on first use so a resumed run picks the same ranges """
+        with self._lock:
+            stored = self._get_meta('seed')
+            if stored is None:
+                self._set_meta('seed', default)
+                return default
+            return stored
+
+    def completed_ranges(self):
+        with self._lock:
+            return set(self._conn.execute("SELECT start, end FROM ranges"))
+
+    def load_state(self):
+        """ Returns the state saved with the last completed ranges, or None for a new checkpoint """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE id = 0").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save(self, token_ranges, state):
+        """ Appends completed ranges and replaces the saved state in one transaction """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO ranges (start, end) VALUES (?, ?)", token_ranges)
+            self._conn.execute("INSERT OR REPLACE INTO state (id, value) VALUES (0, ?)", (json.dumps(state),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
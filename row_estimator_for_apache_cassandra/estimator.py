@@ -14,33 +14,62 @@
 
 from sys import getsizeof, stderr
 import sys
+import logging
 
 from ssl import SSLContext, PROTOCOL_TLSv1_2, CERT_REQUIRED
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
-from cassandra import ConsistencyLevel
-from cassandra.cluster import ExecutionProfile
-from cassandra.policies import WhiteListRoundRobinPolicy
+from cassandra import ConsistencyLevel, ReadTimeout, OperationTimedOut
+from cassandra.protocol import OverloadedErrorMessage
+from cassandra.cluster import ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.query import tuple_factory
+from cassandra.metadata import protect_name, protect_names
+from cassandra.policies import WhiteListRoundRobinPolicy, TokenAwarePolicy, DCAwareRoundRobinPolicy
 
+import copy
 import math
+import random
 from functools import reduce
 import optparse
 import time
 import os
 from datetime import datetime
-from sortedcontainers import SortedDict
 
-from threading import Thread, Event
+from threading import Thread, Event, Condition, Lock, Timer
 
-from collections import deque
+from collections import deque, namedtuple, defaultdict
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import operator
 
-stop_event = Event()
+from row_estimator_for_apache_cassandra.sizes import build_sizer, text_size
+from row_estimator_for_apache_cassandra.stats import StreamingStats, ConvergenceMonitor, PartitionStats
+from row_estimator_for_apache_cassandra.protocol import SizeOnlyProtocolHandler, timed_protocol_handler
+from row_estimator_for_apache_cassandra.checkpoint import Checkpoint
+from row_estimator_for_apache_cassandra.throttle import AIMDController, RateLimiter
+from row_estimator_for_apache_cassandra.metrics import SamplerMetrics
+
+# Murmur3Partitioner token bounds, MIN_TOKEN itself is never assigned to a partition
+MIN_TOKEN = -2**63
+MAX_TOKEN = 2**63 - 1
+
+# Errors that mean the cluster is busy, the query is retried after a pause at a lower concurrency
+OVERLOAD_ERRORS = (ReadTimeout, OperationTimedOut, OverloadedErrorMessage)
+TIMEOUT_ERRORS = (ReadTimeout, OperationTimedOut)
+
+# Schema of a single table as read from system_schema.columns, key columns are ordered by position
+TableSchema = namedtuple('TableSchema', ['columns', 'partition_key', 'clustering_key', 'column_types'])
 
 class Estimator(object):
     
     """ The estimator class containes connetion, stats methods """
     def __init__(self, endpoint_name, port, username=None, password=None, ssl=None, dc=None, keyspace=None,
-                 table=None, execution_timeout=None, token_step=None, rows_per_request=None, pagination=5000, path_cert=None):
+                 table=None, execution_timeout=None, token_step=None, rows_per_request=None, pagination=5000, path_cert=None,
+                 concurrency=1, wire_sizes=False, per_column=False, routing='coordinator', max_in_flight_per_host=2,
+                 target_relative_error=None, confidence=0.95, seed=None, sampling='ring', strata=None,
+                 checkpoint_file=None, checkpoint_interval=30, shard=None, max_p99_ms=None, max_rows_per_sec=None,
+                 max_retries=3, fast_connect=True, aggregate_partitions=False, top_partitions=10,
+                 wide_partition_rows=100, max_partition_rows=100000):
         self.endpoint_name = endpoint_name
         self.port = port
         self.username = username
@@ -54,32 +83,168 @@ class Estimator(object):
         self.rows_per_request = rows_per_request
         self.pagination = pagination
         self.dc = dc
-        self.rows_in_bytes = []
+        self.concurrency = concurrency
+        self.wire_sizes = wire_sizes
+        self.per_column = per_column
+        self.routing = routing
+        self.max_in_flight_per_host = max_in_flight_per_host
+        self.target_relative_error = target_relative_error
+        self.confidence = confidence
+        self.seed = seed
+        self.sampling = sampling
+        self.strata = strata
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        # Row limit of each token range planned by get_weighted_ranges, other ranges read rows_per_request rows
+        self.range_limits = {}
+        # Partitions and bytes of the table according to size_estimates, see get_weighted_ranges
+        self.size_projection = None
+        # (k, n): only read the k-th of n disjoint slices of the token ranges, k counts from 1
+        self.shard = shard
+        # Load limits: concurrency becomes the ceiling of an AIMD controller aiming at max_p99_ms
+        self.max_p99_ms = max_p99_ms
+        self.max_rows_per_sec = max_rows_per_sec
+        self.max_retries = max_retries
+        # Skip the driver's schema download, table schemas are read from system_schema on demand
+        self.fast_connect = fast_connect
+        # Group sampled rows by partition, see _RangeScan.follow_wide_partition for partitions cut by the range limit
+        self.aggregate_partitions = aggregate_partitions
+        self.top_partitions = top_partitions
+        self.wide_partition_rows = wide_partition_rows
+        self.max_partition_rows = max_partition_rows
+        self.partition_stats = None
+        self.row_stats = StreamingStats()
+        self.column_totals = None
+        self.failed_ranges = []
+        self.ranges_total = 0
+        self.ranges_completed = 0
+        self.completed_ranges = []
+        self.timed_out = False
+        self.stop_reason = None
+        self.relative_errors = None
+        # Counters and latencies of every range query, shared with the estimators made by for_table
+        self.metrics = SamplerMetrics()
+        # Set to stop the running row_sampler, see cancel()
+        self.stop_event = Event()
+        # Reason given to cancel() before row_sampler started
+        self._cancel_reason = None
+        self._run = None
+        self._cluster = None
+        self._session = None
+        self._sizing_session = None
+        self._session_lock = Lock()
+        # Estimators made by for_table share the cluster and the in-flight budget of their parent
+        self._shared = False
+        self._shared_window = None
+        self._throttle = None
+        self._rate_limiter = None
+        self._schema_cache = {}
+        self._user_types_cache = {}
+        self._keyspaces_loaded = set()
+        self._schema_lock = Lock()
     
     def get_connection(self):
-        """ Returns Cassandra session """
+        """ Returns the Cassandra session, the cluster is connected once and reused by every method """
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._connect()
+            return self._session
+
+    def _connect(self):
+        """ Builds the pooled cluster and opens a session """
         auth_provider = None
 
         if self.ssl:
-            ssl_context = SSLContext(PROTOCOL_TLSv1)
-            ssl_context.load_verify_locations(path_cert)
+            ssl_context = SSLContext(PROTOCOL_TLSv1_2)
+            ssl_context.load_verify_locations(self.path_cert)
             ssl_context.verify_mode = CERT_REQUIRED
-            #ssl_options = {
-            #    'ca_certs' : self.ssl,
-            #    'ssl_version' : PROTOCOL_TLSv1_2
-            #}
         else:
             ssl_context=None
 
         if (self.username and self.password):
             auth_provider = PlainTextAuthProvider(self.username, self.password)
 
+        def routing_policy():
+            # Replica routing sends range queries to a local replica, other queries stay token aware
+            if self.routing == 'replica':
+                return {'load_balancing_policy': TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=self.dc))}
+            return {}
+
         node1_profile = ExecutionProfile(load_balancing_policy=WhiteListRoundRobinPolicy([self.endpoint_name]))
-        profiles = {'node1': node1_profile}
-        cluster = Cluster([self.endpoint_name], port=self.port ,auth_provider=auth_provider,  ssl_context=ssl_context, control_connection_timeout=360, execution_profiles=profiles)
-        session = cluster.connect()
+        sizes_profile = ExecutionProfile(row_factory=tuple_factory, **routing_policy())
+        profiles = {EXEC_PROFILE_DEFAULT: ExecutionProfile(**routing_policy()), 'node1': node1_profile, 'sizes': sizes_profile}
+        # The token ring is still loaded with fast_connect, replica routing also needs the
+        # replication of the keyspace, see load_keyspace_metadata
+        self._cluster = Cluster([self.endpoint_name], port=self.port ,auth_provider=auth_provider,  ssl_context=ssl_context, control_connection_timeout=360, execution_profiles=profiles,
+                                schema_metadata_enabled=not self.fast_connect)
+        session = self._cluster.connect()
+        session.client_protocol_handler = timed_protocol_handler(session.client_protocol_handler, self.metrics)
         return session
 
+    def get_sizing_session(self):
+        """ Returns a second session of the pooled cluster whose rows are tuples of cell sizes """
+        self.get_connection()
+        with self._session_lock:
+            if self._sizing_session is None:
+                self._sizing_session = self._cluster.connect()
+                self._sizing_session.client_protocol_handler = timed_protocol_handler(SizeOnlyProtocolHandler, self.metrics)
+            return self._sizing_session
+
+    def close(self):
+        """ Shuts down the pooled cluster, a later call to get_connection reconnects """
+        if self._shared:
+            return
+        with self._session_lock:
+            if self._cluster is not None:
+                self._cluster.shutdown()
+            self._cluster = None
+            self._session = None
+            self._sizing_session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load_keyspace_metadata(self, keyspace=None):
+        """ Loads the replication of a single keyspace into the token map when the full schema was skipped """
+        keyspace = keyspace or self.keyspace
+        self.get_connection()
+        if not self.fast_connect:
+            return
+        with self._schema_lock:
+            if keyspace in self._keyspaces_loaded:
+                return
+            self._cluster.refresh_keyspace_metadata(keyspace)
+            self._keyspaces_loaded.add(keyspace)
+
+    def get_table_schema(self, keyspace=None, table=None):
+        """ Returns TableSchema of the table, system_schema is queried once per table """
+        keyspace = keyspace or self.keyspace
+        table = table or self.table
+        key = (keyspace, table)
+        with self._schema_lock:
+            if key not in self._schema_cache:
+                self._schema_cache[key] = self._fetch_table_schema(keyspace, table)
+            return self._schema_cache[key]
+
+    def _fetch_table_schema(self, keyspace, table):
+        session = self.get_connection()
+        columns_results_stmt = session.prepare("select column_name, kind, position, type from system_schema.columns where keyspace_name=? and table_name=?")
+        columns_results_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
+        columns_results = list(session.execute(columns_results_stmt, [keyspace, table]))
+        if not columns_results:
+            raise ValueError("Table %s.%s does not exist" % (keyspace, table))
+
+        def key_columns(kind):
+            return tuple(c.column_name for c in sorted((c for c in columns_results if c.kind == kind), key=lambda c: c.position))
+
+        return TableSchema(columns=tuple(c.column_name for c in columns_results),
+                           partition_key=key_columns('partition_key'),
+                           clustering_key=key_columns('clustering'),
+                           column_types=dict((c.column_name, c.type) for c in columns_results))
+
     def mean(self, lst):
         """ Calculate the mean of list of Cassandra values """
         final_mean = 0.0
@@ -175,83 +340,915 @@ class Estimator(object):
 
     def get_total_column_size(self):
         """ The method returns total size of field names in ResultSets """
-        session = self.get_connection()
-        columns_results_stmt = session.prepare("select column_name from system_schema.columns where keyspace_name=? and table_name=?")
-        columns_results_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
-        columns_results = session.execute(columns_results_stmt, [self.keyspace, self.table])
         clmsum=0
-        for col in columns_results:
-            clmsum += self.total_size(col.column_name, verbose=False)
+        for column_name in self.get_table_schema().columns:
+            clmsum += text_size(column_name)
         return clmsum
 
     def get_partition_key(self):
-        """ The method returns parition key """
-        session = self.get_connection()
-        pk_results_stmt = session.prepare("select column_name, position from system_schema.columns where keyspace_name=? and table_name=? and kind='partition_key' ALLOW FILTERING")
-        pk_results_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
-        pk_results = session.execute(pk_results_stmt, [self.keyspace, self.table])
-        sd = SortedDict()
-        for p in pk_results:
-            sd[p.position]=p.column_name
-
-        if len(sd)>1:
-            pk_string = ','.join(sd.values())
-        else:
-            pk_string = sd.values()[0]
-        return pk_string
+        """ The method returns parition key, quoted for CQL """
+        return ','.join(protect_names(self.get_table_schema().partition_key))
 
     def get_columns(self):
-        """ The method returns all columns """
+        """ The method returns all columns, quoted for CQL """
+        return ','.join(protect_names(self.get_table_schema().columns))
+
+    def get_table_name(self):
+        """ The keyspace and table, quoted for CQL """
+        return protect_name(self.keyspace) + "." + protect_name(self.table)
+
+    def get_token_ranges(self):
+        """ The method returns (start, end] token ranges to sample """
+        if self.sampling == 'stratified':
+            return self.get_strata()
+        if self.sampling == 'weighted':
+            return self.get_weighted_ranges()
+        return self.get_ring_ranges()
+
+    def get_ring_ranges(self):
+        """ Returns every token_step-th range between consecutive tokens of the ring, including the wrap-around range """
         session = self.get_connection()
-        columns_results_stmt = session.prepare("select column_name from system_schema.columns where keyspace_name=? and table_name=?")
-        columns_results_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
-        columns_results = session.execute(columns_results_stmt, [self.keyspace, self.table])
-        clms=[]
-        for c in columns_results:
-            clms.append(c.column_name)
-        if len(clms)>1:
-            cl_string = ','.join(clms)
+        ring = [r.value for r in session.cluster.metadata.token_map.ring]
+        token_ranges = []
+        for i in range(0, len(ring), self.token_step or 1):
+            if i + 1 < len(ring):
+                token_ranges.append((ring[i], ring[i + 1]))
+            else:
+                # The last range wraps around the ring and is read as two queries
+                token_ranges.append((ring[i], MAX_TOKEN))
+                token_ranges.append((MIN_TOKEN, ring[0]))
+        return token_ranges
+
+    def get_strata(self):
+        """
+            Splits the whole Murmur3 ring into equal strata and returns one range per stratum,
+            starting at a random token of the stratum, so rows are read from a random position
+        """
+        strata = self.strata
+        if not strata:
+            session = self.get_connection()
+            strata = max(1, len(session.cluster.metadata.token_map.ring) // (self.token_step or 1))
+        rnd = random.Random(self.seed)
+        width = (MAX_TOKEN - MIN_TOKEN) // strata
+        token_ranges = []
+        for i in range(strata):
+            low = MIN_TOKEN + i * width
+            high = MAX_TOKEN if i == strata - 1 else low + width
+            token_ranges.append((low + rnd.randrange(high - low), high))
+        return token_ranges
+
+    def get_size_estimates(self):
+        """
+            Returns (start, end, partitions_count, mean_partition_size) of the table's token ranges.
+            Every node only estimates its own primary ranges, so each node is asked in turn.
+        """
+        session = self.get_connection()
+        queries = ["select range_start, range_end, partitions_count, mean_partition_size from system.size_estimates "
+                   "where keyspace_name=? and table_name=?",
+                   "select range_start, range_end, partitions_count, mean_partition_size from system.table_estimates "
+                   "where keyspace_name=? and table_name=? and range_type='primary'"]
+        statements = []
+        for query in queries:
+            try:
+                statements.append(session.prepare(query))
+            except Exception as exc:
+                # table_estimates only exists from Cassandra 4.0
+                logging.debug("Cannot prepare %r: %s", query, exc)
+        estimates = {}
+        for host in session.cluster.metadata.all_hosts():
+            if host.is_up is False:
+                continue
+            rows = []
+            for statement in statements:
+                try:
+                    rows = list(session.execute(statement, [self.keyspace, self.table], host=host))
+                    break
+                except Exception as exc:
+                    logging.debug("Size estimates of %s failed: %s", host, exc)
+            for row in rows:
+                start, end = int(row.range_start), int(row.range_end)
+                estimate = (row.partitions_count or 0, row.mean_partition_size or 0)
+                if start < end:
+                    estimates[(start, end)] = estimate
+                else:
+                    # The range that wraps around the ring, its estimate is split in proportion to width
+                    high, low = MAX_TOKEN - start, end - MIN_TOKEN
+                    if high > 0:
+                        estimates[(start, MAX_TOKEN)] = (estimate[0] * high // (high + low), estimate[1])
+                    if low > 0:
+                        estimates[(MIN_TOKEN, end)] = (estimate[0] * low // (high + low), estimate[1])
+        return sorted((start, end, p, m) for (start, end), (p, m) in estimates.items())
+
+    def get_weighted_ranges(self):
+        """
+            Spreads the row budget of ring sampling over the ranges of system.size_estimates in
+            proportion to their bytes. Dense ranges are split into several queries of up to
+            rows_per_request rows, ranges with too little data for a worthwhile query are read
+            with a probability that keeps the expected number of rows.
+        """
+        estimates = self.get_size_estimates()
+        session = self.get_connection()
+        ring_ranges = max(1, len(session.cluster.metadata.token_map.ring) // (self.token_step or 1))
+        plan, self.size_projection = plan_weighted_ranges(estimates, ring_ranges * self.rows_per_request,
+                                                          self.rows_per_request, random.Random(self.seed))
+        if not plan:
+            logging.warning("No size estimates for %s.%s, sampling the ring instead", self.keyspace, self.table)
+            self.range_limits = {}
+            return self.get_ring_ranges()
+        self.range_limits = dict(plan)
+        return [token_range for token_range, _ in plan]
+
+    def get_user_types(self, keyspace=None):
+        """ Returns UDT definitions of the keyspace as {type_name: [(field_name, field_type), ...]} """
+        keyspace = keyspace or self.keyspace
+        with self._schema_lock:
+            if keyspace not in self._user_types_cache:
+                session = self.get_connection()
+                types_stmt = session.prepare("select type_name, field_names, field_types from system_schema.types where keyspace_name=?")
+                types_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
+                self._user_types_cache[keyspace] = dict((t.type_name, list(zip(t.field_names, t.field_types)))
+                                                        for t in session.execute(types_stmt, [keyspace]))
+            return self._user_types_cache[keyspace]
+
+    def get_row_sizer(self, json=False):
+        """ Returns a function that gives the size of a sampled row in bytes, built once per table from column types """
+        if self.wire_sizes:
+            # Rows already are tuples of cell sizes, see SizeOnlyProtocolHandler
+            return sum
+        if json:
+            return lambda row: text_size(str(row.json).replace('null','""'))
+        schema = self.get_table_schema()
+        user_types = self.get_user_types()
+        sizers = [build_sizer(schema.column_types[c], user_types) for c in schema.columns]
+        return lambda row: sum([f(v) for f, v in zip(sizers, row)])
+
+    def prepare_range_query(self, session, json=False):
+        """ Prepares the query of the rows of a (start, end] token range, bound as [start, end, limit] """
+        cl = self.get_columns()
+        pk = self.get_partition_key()
+        if (json == True):
+            tbl_lookup_stmt = session.prepare("SELECT json "+cl+" FROM "+self.get_table_name()+" WHERE token("+pk+")>? AND token("+pk+")<=? LIMIT ?")
         else:
-            cl_string = clms[0]
-        return cl_string
+            tbl_lookup_stmt = session.prepare("SELECT "+cl+" FROM "+self.get_table_name()+" WHERE token("+pk+")>? AND token("+pk+")<=? LIMIT ?")
+        tbl_lookup_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
+        tbl_lookup_stmt.fetch_size=int(self.pagination)
+        return tbl_lookup_stmt
+
+    def prepare_partition_query(self, session):
+        """ Prepares the query of the rows of one partition, bound as [partition key values..., limit] """
+        schema = self.get_table_schema()
+        key = ' AND '.join(c + '=?' for c in protect_names(schema.partition_key))
+        stmt = session.prepare("SELECT "+self.get_columns()+" FROM "+self.get_table_name()+" WHERE "+key+" LIMIT ?")
+        stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
+        stmt.fetch_size = int(self.pagination)
+        return stmt
+
+    def get_sample_ranges(self, checkpoint=None):
+        """ Returns the token ranges of this shard in the order they are read, with the seed kept in checkpoint """
+        if self.shard and self.sampling == 'weighted':
+            # Every worker would plan from size estimates read at a different time, the slices would not fit together
+            raise ValueError("Weighted sampling cannot be sharded, its plan depends on live size estimates")
+        if self.checkpoint_file and self.sampling == 'weighted':
+            # A resumed run would plan other splits than the completed ranges and read parts of them again
+            raise ValueError("Weighted sampling cannot be resumed from a checkpoint, its plan depends on live size estimates")
+        if self.shard and self.seed is None:
+            # Every shard has to pick the same ranges before taking its slice
+            self.seed = 0
+        if checkpoint is not None:
+            # Random choices must be the same when the run is resumed
+            self.seed = checkpoint.seed(self.seed if self.seed is not None else random.randrange(2**31))
+        token_ranges = self.get_token_ranges()
+        if self.shard:
+            k, n = self.shard
+            token_ranges = token_ranges[k - 1::n]
+        if self.target_relative_error:
+            # Adaptive sampling visits ranges in random order and stops once the estimates converge
+            random.Random(self.seed).shuffle(token_ranges)
+        return token_ranges
 
     def row_sampler(self, json=False):
-         a=0
-         session = self.get_connection()
-         cl = self.get_columns()
-         pk = self.get_partition_key()
-         if (json == True):
-             tbl_lookup_stmt = session.prepare("SELECT json "+cl+" FROM "+self.keyspace+"."+self.table+" WHERE token("+pk+")>? AND token("+pk+")<? LIMIT "+str(self.rows_per_request))
-         else:
-             tbl_lookup_stmt = session.prepare("SELECT * FROM "+self.keyspace+"."+self.table+" WHERE token("+pk+")>? AND token("+pk+")<? LIMIT "+str(self.rows_per_request)) 
-         tbl_lookup_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
-         tbl_lookup_stmt.fetch_size=int(self.pagination)
-
-         ring=[]
-         ring_values_by_step=[]
-         rows_bytes=[]
-
-         for r in session.cluster.metadata.token_map.ring:
-             ring.append(r.value)
-         for i in ring[::self.token_step]:
-             ring_values_by_step.append(i)
-         it = iter(ring_values_by_step)
-
-         for val in it:
-             try:
-                 results = session.execute(tbl_lookup_stmt, [val, next(it)])
-                 for row in results:
-                         if (json == True):
-                             s1 = str(row.json).replace('null','""')
-                             rows_bytes.append(self.total_size(s1, verbose=False))
-                         else:
-                             for value in row:
-                                 s1 = str(value)
-                                 a +=self.total_size(s1, verbose=False)
-                             rows_bytes.append(a)
-                             a = 0
-                         if stop_event.is_set():
-                             break
-             except StopIteration:
-                 logger.info("no more token pairs")
-         self.rows_in_bytes = rows_bytes
+        """ Reads token ranges concurrently, up to self.concurrency ranges in flight, and collects row sizes """
+        if self.aggregate_partitions and (self.wire_sizes or json):
+            raise ValueError("Partition aggregation needs the key of every row, it does not work with wire sizes or JSON")
+        session = self.get_sizing_session() if self.wire_sizes else self.get_connection()
+        execution_profile = 'sizes' if self.wire_sizes else EXEC_PROFILE_DEFAULT
+        tbl_lookup_stmt = self.prepare_range_query(session, json)
+
+        router = None
+        if self.routing == 'replica':
+            self.load_keyspace_metadata()
+            router = _ReplicaRouter(session.cluster.metadata.token_map, self.keyspace, self.dc, self.max_in_flight_per_host)
+        self._setup_load_control()
+        run = _SamplerRun(self, session, tbl_lookup_stmt, execution_profile, self.get_row_sizer(json), router)
+        if self.wire_sizes and self.per_column:
+            run.column_totals = [0] * (1 if json else len(self.get_table_schema().columns))
+        if self.aggregate_partitions:
+            run.aggregate_partitions(self.prepare_partition_query(session))
+        checkpoint = None
+        if self.checkpoint_file:
+            checkpoint = Checkpoint(self.checkpoint_file, self._checkpoint_plan(json))
+        token_ranges = self.get_sample_ranges(checkpoint)
+        if self.target_relative_error:
+            run.monitor = ConvergenceMonitor(self.target_relative_error, self.confidence)
+        run.ranges_total = len(token_ranges)
+        if checkpoint is not None:
+            run.attach_checkpoint(checkpoint, self.checkpoint_interval)
+            completed = checkpoint.completed_ranges()
+            token_ranges = [r for r in token_ranges if r not in completed]
+            run.completed_ranges = sorted(completed)
+            logging.info("Resuming from %s: %s token ranges already read", self.checkpoint_file, len(completed))
+        self.metrics.planned(len(token_ranges))
+        self._publish(run)
+
+        if self.stop_event.is_set():
+            # Cancelled before it started
+            run.cancel(self._cancel_reason or 'cancelled')
+        timer = None
+        if self.execution_timeout:
+            timer = Timer(self.execution_timeout, run.cancel, args=('timeout',))
+            timer.daemon = True
+            timer.start()
+        try:
+            for token_range in token_ranges:
+                if not run.window.acquire():
+                    break
+                run.submit(token_range)
+            run.window.drain()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if checkpoint is not None:
+                run.close_checkpoint()
+        self._publish(run)
+        self.stop_event.clear()
+        self._cancel_reason = None
+
+        if self.stop_reason == 'converged':
+            logging.info("Estimates converged after %s of %s token ranges", run.ranges_completed, run.ranges_total)
+        elif self.stop_reason:
+            logging.warning("Sampling stopped (%s) after %s of %s token ranges", self.stop_reason, run.ranges_completed, run.ranges_total)
+        if self.failed_ranges:
+            logging.warning("Failed to read %s token ranges", len(self.failed_ranges))
+        if self._throttle is not None and not self._shared:
+            logging.info("Concurrency settled at %s (%s increases, %s cuts)",
+                         self._throttle.limit, self._throttle.increases, self._throttle.decreases)
+
+    def _setup_load_control(self):
+        """ Creates the throttle and rate limiter, estimators made by for_table share their parent's """
+        if self.max_p99_ms and self._throttle is None:
+            self._throttle = AIMDController(self.max_p99_ms, self.concurrency)
+        if self.max_rows_per_sec and self._rate_limiter is None:
+            self._rate_limiter = RateLimiter(self.max_rows_per_sec)
+
+    def summary(self):
+        """ Returns the statistics of the last row_sampler run as a dict """
+        stats = self.row_stats
+        summary = {'keyspace': self.keyspace, 'table': self.table, 'rows': stats.count,
+                   'ranges_completed': self.ranges_completed, 'ranges_total': self.ranges_total,
+                   'failed_ranges': len(self.failed_ranges), 'stop_reason': self.stop_reason}
+        if stats.count:
+            summary.update({'mean': stats.mean, 'stddev': stats.stddev, 'min': stats.min, 'max': stats.max,
+                            'p10': stats.quantile(0.1), 'p50': stats.quantile(0.5),
+                            'p90': stats.quantile(0.9), 'p99': stats.quantile(0.99)})
+        if self.size_projection:
+            summary['estimated_partitions'] = self.size_projection['partitions']
+            summary['estimated_bytes'] = self.size_projection['bytes']
+        partitions = self.partition_stats
+        if partitions is not None and partitions.count:
+            summary['partitions'] = {'count': partitions.count, 'truncated': partitions.truncated,
+                                     'rows_p50': partitions.rows.quantile(0.5), 'rows_p99': partitions.rows.quantile(0.99),
+                                     'rows_max': partitions.rows.max, 'bytes_p50': partitions.bytes.quantile(0.5),
+                                     'bytes_p99': partitions.bytes.quantile(0.99), 'bytes_max': partitions.bytes.max,
+                                     'largest': partitions.largest()}
+        return summary
+
+    def get_tables(self, keyspaces):
+        """ Returns (keyspace, table) pairs of every table in the keyspaces """
+        session = self.get_connection()
+        tables_stmt = session.prepare("select table_name from system_schema.tables where keyspace_name=?")
+        tables_stmt.consistency_level = ConsistencyLevel.LOCAL_ONE
+        tables = []
+        for keyspace in keyspaces:
+            tables.extend((keyspace, t.table_name) for t in session.execute(tables_stmt, [keyspace]))
+        return tables
+
+    def for_table(self, keyspace, table):
+        """ Returns an estimator of another table with the same settings, sharing this one's session and schema cache """
+        self.get_connection()
+        if self.wire_sizes:
+            self.get_sizing_session()
+        estimator = copy.copy(self)
+        estimator.keyspace = keyspace
+        estimator.table = table
+        estimator.row_stats = StreamingStats()
+        estimator.column_totals = None
+        estimator.failed_ranges = []
+        estimator.ranges_total = estimator.ranges_completed = 0
+        estimator.completed_ranges = []
+        estimator.range_limits = {}
+        estimator.size_projection = None
+        estimator.partition_stats = None
+        estimator.timed_out = False
+        estimator.stop_reason = None
+        estimator.relative_errors = None
+        estimator.stop_event = Event()
+        estimator._cancel_reason = None
+        estimator._run = None
+        estimator._shared = True
+        if self.checkpoint_file:
+            estimator.checkpoint_file = '%s.%s.%s' % (self.checkpoint_file, keyspace, table)
+        return estimator
+
+    def estimate_tables(self, tables, json=False, table_workers=4):
+        """
+            Samples several tables at once, table_workers tables at a time. All tables share
+            this estimator's session and at most self.concurrency ranges are in flight in total.
+            execution_timeout bounds the whole job. Yields a summary per table as it finishes.
+        """
+        self._shared_window = _InFlightWindow(self.concurrency)
+        self._setup_load_control()
+        if self._throttle is not None:
+            self._shared_window.set_limit(self._throttle.limit)
+        estimators = [self.for_table(keyspace, table) for keyspace, table in tables]
+        for estimator in estimators:
+            estimator.execution_timeout = None
+        expired = Event()
+
+        def sample(estimator):
+            if expired.is_set():
+                # Not started before the deadline, no schema lookup or prepare
+                estimator.stop_reason = 'timeout'
+                estimator.timed_out = True
+                return estimator.summary()
+            try:
+                estimator.row_sampler(json=json)
+            except Exception as exc:
+                logging.warning("Sampling %s.%s failed: %s", estimator.keyspace, estimator.table, exc)
+                summary = estimator.summary()
+                summary['error'] = str(exc)
+                return summary
+            return estimator.summary()
+
+        def cancel_all():
+            expired.set()
+            for estimator in estimators:
+                estimator.cancel('timeout')
+
+        timer = None
+        if self.execution_timeout:
+            timer = Timer(self.execution_timeout, cancel_all)
+            timer.daemon = True
+            timer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, table_workers)) as pool:
+                futures = [pool.submit(sample, estimator) for estimator in estimators]
+                for future in as_completed(futures):
+                    yield future.result()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._shared_window = None
+
+    def _checkpoint_plan(self, json):
+        """ Settings that decide which token ranges are read and how rows are measured """
+        return {'keyspace': self.keyspace, 'table': self.table, 'json': bool(json), 'sampling': self.sampling,
+                'token_step': self.token_step, 'strata': self.strata, 'rows_per_request': self.rows_per_request,
+                'wire_sizes': bool(self.wire_sizes), 'target_relative_error': self.target_relative_error,
+                'shard': list(self.shard) if self.shard else None, 'aggregate_partitions': bool(self.aggregate_partitions)}
+
+    def cancel(self, reason='cancelled'):
+        """ Stops the running row_sampler, statistics gathered so far are kept """
+        self._cancel_reason = reason
+        self.stop_event.set()
+        if self._run is not None:
+            self._run.cancel(reason)
+            self._publish(self._run)
+
+    def _publish(self, run):
+        self._run = run
+        self.row_stats = run.row_stats
+        self.column_totals = run.column_totals
+        self.failed_ranges = run.failed_ranges
+        self.ranges_total = run.ranges_total
+        self.ranges_completed = run.ranges_completed
+        self.completed_ranges = run.completed_ranges
+        self.partition_stats = run.partition_stats
+        self.stop_reason = run.stop_reason
+        self.timed_out = run.stop_reason == 'timeout'
+        if run.monitor is not None:
+            self.relative_errors = run.monitor.relative_errors(run.row_stats)
+
+
+def plan_weighted_ranges(estimates, row_budget, rows_per_request, rnd):
+    """
+        Returns ([((start, end), limit), ...], projection) for estimates of (start, end, partitions, mean_size).
+        A range gets row_budget * its share of the table's bytes, read by queries of at most
+        rows_per_request rows over equal slices of the range. Ranges whose share is less than
+        one query are picked by systematic sampling with probability proportional to their share
+        and read with a full query, so no round trip is spent on a handful of rows.
+    """
+    weights = [(start, end, partitions * mean_size) for start, end, partitions, mean_size in estimates if partitions > 0]
+    total = sum(w for _, _, w in weights)
+    projection = {'partitions': sum(p for _, _, p, _ in estimates), 'bytes': total}
+    if total <= 0:
+        return [], projection
+    plan = []
+    # Running sum of the query shares of small ranges, a range is picked when it crosses the next threshold
+    share, threshold = 0.0, rnd.random()
+    for start, end, weight in weights:
+        rows = float(row_budget) * weight / total
+        if rows < rows_per_request:
+            share += rows / rows_per_request
+            if share >= threshold:
+                plan.append(((start, end), rows_per_request))
+                threshold += 1
+            continue
+        queries = int(math.ceil(rows / rows_per_request))
+        limit = int(math.ceil(rows / queries))
+        step = (end - start) // queries
+        for i in range(queries):
+            low = start + i * step
+            high = end if i == queries - 1 else low + step
+            if high > low:
+                plan.append(((low, high), limit))
+    return plan, projection
+
+
+class _SamplerRun(object):
+    """ State shared by the range scans of one row_sampler call """
+    def __init__(self, estimator, session, statement, execution_profile, row_size, router=None):
+        self.estimator = estimator
+        self.session = session
+        self.statement = statement
+        self.execution_profile = execution_profile
+        self.row_size = row_size
+        self.router = router
+        self.window = _InFlightWindow(estimator.concurrency, estimator._shared_window)
+        self.throttle = estimator._throttle
+        self.rate_limiter = estimator._rate_limiter
+        self.metrics = estimator.metrics
+        # The throttle adjusts the window that bounds the whole job
+        self.load_window = estimator._shared_window or self.window
+        if self.throttle is not None and estimator._shared_window is None:
+            self.window.set_limit(self.throttle.limit)
+        self.row_stats = StreamingStats()
+        # Bytes per column over all sampled rows, only collected for wire sizes
+        self.column_totals = None
+        self.failed_ranges = []
+        self.ranges_total = 0
+        self.ranges_completed = 0
+        # Token ranges read to the end, the coverage recorded in result files
+        self.completed_ranges = []
+        # Set by aggregate_partitions
+        self.partition_stats = None
+        self.partition_key = None
+        self.partition_statement = None
+        self.monitor = None
+        self.stop_reason = None
+        self.checkpoint = None
+        self._pending_ranges = []
+        self._active = set()
+        self._lock = Lock()
+
+    def aggregate_partitions(self, statement):
+        """ Groups rows by partition, statement reads the rest of a wide partition (see prepare_partition_query) """
+        estimator = self.estimator
+        schema = estimator.get_table_schema()
+        self.partition_stats = PartitionStats(estimator.top_partitions)
+        self.partition_key = operator.itemgetter(*[schema.columns.index(c) for c in schema.partition_key])
+        self.composite_key = len(schema.partition_key) > 1
+        self.partition_statement = statement
+        # Write units count column names as well, like the row sizes reported with them
+        self.column_names_bytes = estimator.get_total_column_size()
+
+    def attach_checkpoint(self, checkpoint, interval):
+        """ Restores the statistics saved in the checkpoint and saves progress every interval seconds """
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = interval
+        self._checkpointed_at = time.monotonic()
+        state = checkpoint.load_state()
+        if state is None:
+            return
+        self.row_stats = StreamingStats.from_dict(state['row_stats'])
+        self.ranges_completed = state['ranges_completed']
+        if state.get('column_totals') is not None and self.column_totals is not None:
+            self.column_totals = state['column_totals']
+        if state.get('monitor') is not None and self.monitor is not None:
+            self.monitor.load(state['monitor'])
+        if state.get('partition_stats') is not None and self.partition_stats is not None:
+            self.partition_stats = PartitionStats.from_dict(state['partition_stats'])
+
+    def _save_checkpoint(self):
+        # The caller holds self._lock, so the state matches the saved ranges
+        state = {'row_stats': self.row_stats.to_dict(), 'ranges_completed': self.ranges_completed,
+                 'column_totals': self.column_totals,
+                 'monitor': None if self.monitor is None else self.monitor.to_dict(),
+                 'partition_stats': None if self.partition_stats is None else self.partition_stats.to_dict()}
+        self.checkpoint.save(self._pending_ranges, state)
+        self._pending_ranges = []
+        self._checkpointed_at = time.monotonic()
+
+    def close_checkpoint(self):
+        with self._lock:
+            # After a cancel row_stats also holds rows of abandoned ranges, it was saved before that
+            if not self.cancelled:
+                self._save_checkpoint()
+            self.checkpoint.close()
+
+    @property
+    def cancelled(self):
+        return self.estimator.stop_event.is_set()
+
+    def submit(self, token_range):
+        """ Starts reading a token range, the caller holds a slot of the window """
+        host = self.router.acquire(token_range) if self.router else None
+        delay = self.request_delay()
+        if delay:
+            self.estimator.stop_event.wait(delay)
+        if self.cancelled:
+            if self.router and host is not None:
+                self.router.release(host)
+            self.window.release()
+            return
+        scan = _RangeScan(self, token_range, host)
+        with self._lock:
+            self._active.add(scan)
+        self.metrics.range_started()
+        scan.start()
+
+    def range_limit(self, token_range):
+        return self.estimator.range_limits.get(token_range, self.estimator.rows_per_request)
+
+    def execute(self, token_range, host, paging_state=None):
+        return self.session.execute_async(self.statement, [token_range[0], token_range[1], self.range_limit(token_range)],
+                                          execution_profile=self.execution_profile, host=host, paging_state=paging_state)
+
+    def execute_partition(self, key, host, paging_state=None):
+        """ Reads the rows of the partition with key, as returned by partition_key """
+        values = list(key) if self.composite_key else [key]
+        return self.session.execute_async(self.partition_statement, values + [self.estimator.max_partition_rows],
+                                          execution_profile=self.execution_profile, host=host, paging_state=paging_state)
+
+    def request_delay(self):
+        """ Seconds to wait before the next query to stay under max_rows_per_sec """
+        return self.rate_limiter.delay() if self.rate_limiter is not None else 0.0
+
+    def page_read(self, rows, nbytes, latency, sizing_seconds):
+        """ Feeds the metrics, the throttle and the rate limiter with a page that arrived after latency seconds """
+        self.metrics.page_read(rows, nbytes, latency, sizing_seconds)
+        if self.rate_limiter is not None:
+            self.rate_limiter.consume(rows)
+        if self.throttle is not None:
+            limit = self.throttle.record(latency * 1000.0)
+            if limit is not None:
+                self.load_window.set_limit(limit)
+
+    def retry_delay(self, scan, exc):
+        """ Returns the pause before retrying the page that failed with exc, or None to give up the range """
+        if not isinstance(exc, OVERLOAD_ERRORS):
+            return None
+        self.metrics.page_failed('timeout' if isinstance(exc, TIMEOUT_ERRORS) else 'overloaded')
+        if self.throttle is not None:
+            limit = self.throttle.overloaded(scan._sent_at)
+            if limit is not None:
+                logging.info("Cluster busy (%s), concurrency cut to %s", type(exc).__name__, limit)
+                self.load_window.set_limit(limit)
+        if scan.retries >= self.estimator.max_retries or self.cancelled:
+            return None
+        scan.retries += 1
+        self.metrics.retried()
+        return 0.1 * 2 ** scan.retries
+
+    def schedule(self, fn, delay):
+        """ Calls fn now, or after delay seconds from a timer so the driver's event loop is never blocked """
+        if delay <= 0:
+            fn()
+            return
+        timer = Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+
+    def cancel(self, reason):
+        """ Stops issuing queries and abandons in-flight ranges, rows already read are kept """
+        with self._lock:
+            if self.checkpoint is not None and not self.cancelled:
+                self._save_checkpoint()
+            self.estimator.stop_event.set()
+            if self.stop_reason is None:
+                self.stop_reason = reason
+            active = list(self._active)
+        self.window.close()
+        if self.router:
+            self.router.close()
+        for scan in active:
+            if scan.future is not None:
+                scan.future.clear_callbacks()
+            self._finish(scan)
+
+    def _finish(self, scan, completed=False, exc=None):
+        """ Accounts a range exactly once, whether it was read, failed or abandoned """
+        with scan.lock:
+            if scan.finished:
+                return
+            scan.finished = True
+        outcome = 'failed' if exc is not None else 'completed' if completed else 'abandoned'
+        self.metrics.range_finished(scan.token_range, time.monotonic() - scan.started_at, outcome)
+        converged = False
+        with self._lock:
+            self._active.discard(scan)
+            if exc is not None:
+                self.failed_ranges.append(scan.token_range)
+            else:
+                self.row_stats.merge(scan.stats)
+                if scan.partitions is not None:
+                    if scan.partition is not None:
+                        # Abandoned while the partition was being read
+                        scan.partitions.add(*scan.partition, truncated=True)
+                    self.partition_stats.merge(scan.partitions)
+                if scan.column_totals is not None:
+                    self.column_totals = list(map(operator.add, self.column_totals, scan.column_totals))
+                if completed:
+                    self.ranges_completed += 1
+                    self.completed_ranges.append(scan.token_range)
+                    if self.monitor is not None:
+                        self.monitor.add_range(scan.stats.count, scan.stats.total)
+                        converged = not self.cancelled and self.monitor.converged(self.row_stats)
+                    if self.checkpoint is not None and not self.cancelled:
+                        self._pending_ranges.append(scan.token_range)
+                        if time.monotonic() - self._checkpointed_at >= self.checkpoint_interval:
+                            self._save_checkpoint()
+        if self.router and scan.host is not None:
+            self.router.release(scan.host)
+        self.window.release()
+        if converged:
+            self.cancel('converged')
+
+    def range_done(self, scan):
+        self._finish(scan, completed=True)
+
+    def range_failed(self, scan, exc):
+        logging.warning("Token range %s failed: %s", scan.token_range, exc)
+        self._finish(scan, exc=exc)
+
+
+class _ReplicaRouter(object):
+    """ Picks the least busy local replica of each token range, with at most per_host ranges in flight on a host """
+    def __init__(self, token_map, keyspace, dc, per_host):
+        self.token_map = token_map
+        self.keyspace = keyspace
+        self.dc = dc
+        self.per_host = max(1, int(per_host))
+        self.in_flight = defaultdict(int)
+        self.closed = False
+        self._cond = Condition()
+
+    def replicas(self, token_range):
+        # A range (start, end] is owned by the replicas of its end token
+        token = self.token_map.token_class(token_range[1])
+        return [h for h in self.token_map.get_replicas(self.keyspace, token)
+                if h.is_up is not False and (not self.dc or h.datacenter == self.dc)]
+
+    def acquire(self, token_range):
+        """ Returns the host to query, or None to let the load balancing policy choose """
+        replicas = self.replicas(token_range)
+        if not replicas:
+            return None
+        with self._cond:
+            while not self.closed:
+                host = min(replicas, key=lambda h: self.in_flight[h])
+                if self.in_flight[host] < self.per_host:
+                    self.in_flight[host] += 1
+                    return host
+                self._cond.wait()
+            return None
+
+    def release(self, host):
+        with self._cond:
+            self.in_flight[host] -= 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _InFlightWindow(object):
+    """
+        Bounds the number of token ranges being read at the same time. A window with a parent
+        also takes a slot of the parent, so several runs can share one concurrency budget.
+    """
+    def __init__(self, limit, parent=None):
+        self.limit = max(1, int(limit))
+        self.parent = parent
+        self.in_flight = 0
+        self.closed = False
+        self._cond = Condition()
+
+    def acquire(self, give_up=None):
+        """ Takes a slot, returns False once the window is closed or give_up() is true """
+        with self._cond:
+            while self.in_flight >= self.limit and not self.closed and not (give_up and give_up()):
+                self._cond.wait()
+            if self.closed or (give_up and give_up()):
+                return False
+            self.in_flight += 1
+        if self.parent is not None and not self.parent.acquire(lambda: self.closed):
+            self._release()
+            return False
+        return True
+
+    def _release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def release(self):
+        self._release()
+        if self.parent is not None:
+            self.parent.release()
+
+    def set_limit(self, limit):
+        """ Changes the number of slots, slots already taken are kept """
+        with self._cond:
+            self.limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def wake(self):
+        """ Makes waiters check their give_up condition again """
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if self.parent is not None:
+            self.parent.wake()
+
+    def drain(self):
+        """ Blocks until every acquired slot is released """
+        with self._cond:
+            while self.in_flight > 0:
+                self._cond.wait()
+
+
+class _RangeScan(object):
+    """ Consumes pages of a single token range query as they arrive from the driver """
+    def __init__(self, run, token_range, host=None):
+        self.run = run
+        self.future = None
+        self.token_range = token_range
+        self.host = host
+        # Rows of this range are merged into the run statistics once the range is finished
+        self.stats = StreamingStats()
+        self.column_totals = None if run.column_totals is None else [0] * len(run.column_totals)
+        self.finished = False
+        self.lock = Lock()
+        # Where to resume the range when a page has to be retried
+        self.paging_state = None
+        self.retries = 0
+        self.started_at = time.monotonic()
+        self._sent_at = None
+        # Partition aggregation: the partition being read as [key, rows, bytes, write units],
+        # and the follow-up query of a wide partition cut by the range limit
+        self.partitions = None if run.partition_stats is None else PartitionStats(run.partition_stats.top_k)
+        self.partition = None
+        self.rows_read = 0
+        self.wide_key = None
+        self.wide_seen = 0
+        self.wide_skip = 0
+
+    def start(self):
+        self._sent_at = time.monotonic()
+        if self.wide_key is None:
+            self.future = self.run.execute(self.token_range, self.host, self.paging_state)
+        else:
+            self.future = self.run.execute_partition(self.wide_key, self.host, self.paging_state)
+        self.future.add_callbacks(callback=self.handle_page, errback=self.handle_error)
+
+    def fetch_next_page(self):
+        if self.finished or self.run.cancelled:
+            return
+        self._sent_at = time.monotonic()
+        self.future.start_fetching_next_page()
+
+    def handle_page(self, rows):
+        received_at = time.monotonic()
+        row_size = self.run.row_size
+        add = self.stats.add
+        error = None
+        with self.lock:
+            # An abandoned range ignores pages that were already in flight
+            if self.finished:
+                return
+            total, wide_bytes = self.stats.total, 0
+            try:
+                if self.wide_key is not None:
+                    wide_bytes = self.add_wide_partition_rows(rows)
+                elif self.partitions is not None:
+                    self.add_rows_by_partition(rows)
+                else:
+                    for row in rows:
+                        add(row_size(row))
+                if self.column_totals is not None:
+                    for row in rows:
+                        self.column_totals = list(map(operator.add, self.column_totals, row))
+            except Exception as exc:
+                error = exc
+            nbytes = self.stats.total - total + wide_bytes
+        self.run.page_read(len(rows), nbytes, received_at - self._sent_at, time.monotonic() - received_at)
+        if error is not None:
+            self.run.range_failed(self, error)
+        # The next page is requested only after the current one is consumed, so a range
+        # never has more than one page in flight
+        elif self.future.has_more_pages and not self.run.cancelled:
+            # ResponseFuture has no public accessor for the paging state of the last page
+            self.paging_state = self.future._paging_state
+            self.run.schedule(self.fetch_next_page, self.run.request_delay())
+        elif self.partitions is None or not self.follow_wide_partition():
+            self.run.range_done(self)
+
+    def add_rows_by_partition(self, rows):
+        """ Adds the sizes of rows and accumulates them per partition, rows of a partition are contiguous """
+        row_size, add, key_of = self.run.row_size, self.stats.add, self.run.partition_key
+        names = self.run.column_names_bytes
+        partition = self.partition
+        for row in rows:
+            size = row_size(row)
+            add(size)
+            key = key_of(row)
+            if partition is None or key != partition[0]:
+                if partition is not None:
+                    self.partitions.add(*partition)
+                partition = [key, 0, 0, 0]
+            partition[1] += 1
+            partition[2] += size
+            partition[3] += (size + names + 1023) // 1024
+        self.partition = partition
+        self.rows_read += len(rows)
+
+    def add_wide_partition_rows(self, rows):
+        """ Adds a page of the follow-up query to the partition, skipping the rows read by the range query """
+        row_size, names, partition = self.run.row_size, self.run.column_names_bytes, self.partition
+        nbytes = 0
+        for row in rows:
+            self.wide_seen += 1
+            if self.wide_seen <= self.wide_skip:
+                continue
+            size = row_size(row)
+            nbytes += size
+            partition[1] += 1
+            partition[2] += size
+            partition[3] += (size + names + 1023) // 1024
+        return nbytes
+
+    def follow_wide_partition(self):
+        """
+            Called when the range query is read to the end. When the range limit cut the last
+            partition after at least wide_partition_rows of its rows, the partition alone is
+            queried again and read up to max_partition_rows rows. Returns True if that query
+            was sent or the range was abandoned meanwhile, the range is done when it returns False.
+        """
+        estimator = self.run.estimator
+        with self.lock:
+            if self.finished:
+                # Abandoned by cancel() after the page was handled, _finish already merged the partitions
+                return True
+            if self.partition is None:
+                return False
+            if self.wide_key is not None:
+                # The follow-up query is read to the end
+                self.partitions.add(*self.partition, truncated=self.wide_seen >= estimator.max_partition_rows)
+                self.partition = None
+                return False
+            limit = self.run.range_limit(self.token_range)
+            cut = self.rows_read >= limit
+            if not cut or self.partition[1] < min(estimator.wide_partition_rows, limit) or self.run.cancelled:
+                # A partition cut with fewer rows is counted as read, it may have had more
+                self.partitions.add(*self.partition, truncated=cut)
+                self.partition = None
+                return False
+            # CQL cannot resume after a clustering key for every clustering order, the follow-up
+            # starts at the head of the partition and skips the rows already counted
+            self.wide_key = self.partition[0]
+            self.wide_skip = self.partition[1]
+            self.wide_seen = 0
+            self.paging_state = None
+        self.run.schedule(self.retry, self.run.request_delay())
+        return True
+
+    def handle_error(self, exc):
+        if self.finished:
+            return
+        delay = self.run.retry_delay(self, exc)
+        if delay is None:
+            self.run.range_failed(self, exc)
+        else:
+            logging.debug("Retrying token range %s in %ss: %s", self.token_range, delay, exc)
+            self.run.schedule(self.retry, delay)
+
+    def retry(self):
+        if self.finished or self.run.cancelled:
+            return
+        self.start()
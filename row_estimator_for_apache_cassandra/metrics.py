@@ -0,0 +1,300 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Instrumentation of the sampler: counters, latency histograms, progress lines, metrics files and profiling """
+
+import cProfile
+import heapq
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds of the latency histogram buckets, as in Prometheus client libraries
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Slowest token ranges kept for the report
+SLOW_RANGES = 5
+
+
+class LatencyHistogram(object):
+    """ Counts of observations per bucket of LATENCY_BUCKETS, the last bucket is +Inf """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """ Upper bound of the bucket holding the q-quantile, at most the largest observation """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        cumulative, seen = [], 0
+        for bound, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            seen += n
+            cumulative.append([bound, seen])
+        return {'count': self.count, 'sum': self.sum, 'max': self.max, 'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99), 'buckets': cumulative}
+
+
+class SamplerMetrics(object):
+    """
+        Counters of a sampling job, updated from the driver's event loop as pages arrive.
+        Time is split into driver wait (query sent to page received, decoding included),
+        decoding of responses (timed by the protocol handler, see timed_protocol_handler)
+        and size computation of the sampled rows.
+    """
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.started_at = clock()
+        self._cpu_started = time.process_time()
+        self.ranges_planned = 0
+        self.ranges_started = 0
+        self.ranges_completed = 0
+        self.ranges_failed = 0
+        self.ranges_abandoned = 0
+        self.pages = 0
+        self.rows = 0
+        self.bytes = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.overloaded = 0
+        self.driver_wait_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.sizing_seconds = 0.0
+        self.page_latency = LatencyHistogram()
+        self.range_latency = LatencyHistogram()
+        # Min-heap of (seconds, token range) of the slowest ranges
+        self.slowest_ranges = []
+        self._lock = threading.Lock()
+
+    def planned(self, ranges):
+        with self._lock:
+            self.ranges_planned += ranges
+
+    def range_started(self):
+        with self._lock:
+            self.ranges_started += 1
+
+    def page_read(self, rows, nbytes, latency, sizing_seconds):
+        with self._lock:
+            self.pages += 1
+            self.rows += rows
+            self.bytes += nbytes
+            self.driver_wait_seconds += latency
+            self.sizing_seconds += sizing_seconds
+            self.page_latency.observe(latency)
+
+    def decoded(self, seconds):
+        with self._lock:
+            self.decode_seconds += seconds
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def page_failed(self, kind):
+        """ Counts a page that failed with a timeout (kind 'timeout') or an overloaded node ('overloaded') """
+        with self._lock:
+            if kind == 'timeout':
+                self.timeouts += 1
+            elif kind == 'overloaded':
+                self.overloaded += 1
+
+    def range_finished(self, token_range, seconds, outcome):
+        """ Counts a range by outcome: 'completed', 'failed' or 'abandoned' by a stop before its last page """
+        with self._lock:
+            if outcome == 'completed':
+                self.ranges_completed += 1
+                self.range_latency.observe(seconds)
+                entry = (seconds, tuple(token_range))
+                if len(self.slowest_ranges) < SLOW_RANGES:
+                    heapq.heappush(self.slowest_ranges, entry)
+                elif entry > self.slowest_ranges[0]:
+                    heapq.heapreplace(self.slowest_ranges, entry)
+            elif outcome == 'failed':
+                self.ranges_failed += 1
+            else:
+                self.ranges_abandoned += 1
+
+    def to_dict(self):
+        """ Snapshot of every metric, rates are over the time since the metrics were created """
+        with self._lock:
+            elapsed = max(self._clock() - self.started_at, 1e-9)
+            return {'elapsed_seconds': elapsed,
+                    'cpu_seconds': time.process_time() - self._cpu_started,
+                    'ranges_planned': self.ranges_planned,
+                    'ranges_completed': self.ranges_completed,
+                    'ranges_failed': self.ranges_failed,
+                    'ranges_abandoned': self.ranges_abandoned,
+                    'ranges_in_flight': (self.ranges_started - self.ranges_completed - self.ranges_failed
+                                         - self.ranges_abandoned),
+                    'pages': self.pages, 'rows': self.rows, 'bytes': self.bytes,
+                    'rows_per_sec': self.rows / elapsed, 'bytes_per_sec': self.bytes / elapsed,
+                    'retries': self.retries, 'timeouts': self.timeouts, 'overloaded': self.overloaded,
+                    'time_split_seconds': {'driver_wait': self.driver_wait_seconds, 'decode': self.decode_seconds,
+                                           'sizing': self.sizing_seconds},
+                    'page_latency_seconds': self.page_latency.to_dict(),
+                    'range_latency_seconds': self.range_latency.to_dict(),
+                    'slowest_ranges': [{'token_range': list(r), 'seconds': s}
+                                       for s, r in sorted(self.slowest_ranges, reverse=True)]}
+
+    def progress_line(self):
+        m = self.to_dict()
+        page = m['page_latency_seconds']
+        latency = ''
+        if page['count']:
+            latency = ', page latency p50 %.0f ms p99 %.0f ms' % (page['p50'] * 1000, page['p99'] * 1000)
+        return ("%s/%s ranges (%s failed, %s in flight), %s rows, %s pages, %.0f rows/s, %.0f bytes/s%s, "
+                "%s retries, %s timeouts" % (m['ranges_completed'], m['ranges_planned'], m['ranges_failed'],
+                                             m['ranges_in_flight'], m['rows'], m['pages'], m['rows_per_sec'],
+                                             m['bytes_per_sec'], latency, m['retries'], m['timeouts']))
+
+
+def to_prometheus(metrics, prefix='row_estimator'):
+    """ The metrics in the Prometheus text exposition format, for the node_exporter textfile collector """
+    m = metrics.to_dict()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        for suffix, labels, value in samples:
+            label_text = '{%s}' % ','.join('%s="%s"' % kv for kv in labels) if labels else ''
+            lines.append('%s_%s%s%s %s' % (prefix, name, suffix, label_text, repr(float(value))))
+
+    def histogram(name, help_text, h):
+        samples = [('_bucket', [('le', bound)], n) for bound, n in h['buckets']]
+        samples += [('_sum', [], h['sum']), ('_count', [], h['count'])]
+        metric(name, 'histogram', help_text, samples)
+
+    metric('elapsed_seconds', 'gauge', 'Seconds since sampling started', [('', [], m['elapsed_seconds'])])
+    metric('cpu_seconds_total', 'counter', 'CPU seconds of the process', [('', [], m['cpu_seconds'])])
+    metric('ranges_planned', 'gauge', 'Token ranges to read', [('', [], m['ranges_planned'])])
+    metric('ranges_in_flight', 'gauge', 'Token ranges being read', [('', [], m['ranges_in_flight'])])
+    metric('ranges_total', 'counter', 'Token ranges finished, by outcome',
+           [('', [('outcome', 'completed')], m['ranges_completed']), ('', [('outcome', 'failed')], m['ranges_failed']),
+            ('', [('outcome', 'abandoned')], m['ranges_abandoned'])])
+    metric('pages_total', 'counter', 'Pages fetched', [('', [], m['pages'])])
+    metric('rows_total', 'counter', 'Rows sampled', [('', [], m['rows'])])
+    metric('bytes_total', 'counter', 'Bytes of the sampled rows', [('', [], m['bytes'])])
+    metric('retries_total', 'counter', 'Pages retried', [('', [], m['retries'])])
+    metric('errors_total', 'counter', 'Failed pages, by kind',
+           [('', [('kind', 'timeout')], m['timeouts']), ('', [('kind', 'overloaded')], m['overloaded'])])
+    metric('phase_seconds_total', 'counter', 'Seconds spent per phase, driver_wait includes decode',
+           [('', [('phase', phase)], seconds) for phase, seconds in sorted(m['time_split_seconds'].items())])
+    histogram('page_latency_seconds', 'Latency of range query pages', m['page_latency_seconds'])
+    histogram('range_latency_seconds', 'Time to read a token range', m['range_latency_seconds'])
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path, metrics, fmt='json'):
+    """ Writes the metrics to path, replacing the file at once so collectors never read half a file """
+    text = to_prometheus(metrics) if fmt == 'prometheus' else json.dumps(metrics.to_dict(), indent=2)
+    tmp = '%s.tmp' % path
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class MetricsReporter(object):
+    """ Logs a progress line and rewrites the metrics file every interval seconds, until stop() """
+    def __init__(self, metrics, interval, path=None, fmt='json'):
+        self.metrics = metrics
+        self.interval = interval
+        self.path = path
+        self.fmt = fmt
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.interval:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-reporter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self):
+        logging.info("Progress: %s", self.metrics.progress_line())
+        if self.path:
+            try:
+                write_metrics(self.path, self.metrics, self.fmt)
+            except OSError as exc:
+                logging.warning("Cannot write metrics to %s: %s", self.path, exc)
+
+    def stop(self):
+        """ Stops the reports and writes the final metrics file """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.path:
+            write_metrics(self.path, self.metrics, self.fmt)
+
+
+class ThreadProfiler(object):
+    """
+        cProfile of the calling thread and of every thread started after start(), such as the
+        driver's event loop where pages are handled. Connect only after start(). From Python
+        3.12 a profile sees every thread by itself.
+    """
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, frame, event, arg):
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        # Replaces this hook as the thread's profile function
+        profile.enable()
+
+    def start(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        self._profile_thread(None, None, None)
+
+    def stop(self, path=None, limit=25, stream=sys.stderr):
+        """ Prints the functions with most own time, and saves the combined stats to path """
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self.profiles)
+        # Disables the calling thread's profile, the others are read as they are
+        profiles[0].disable()
+        stats = pstats.Stats(*profiles, stream=stream)
+        if path:
+            stats.dump_stats(path)
+        stats.sort_stats('tottime').print_stats(limit)
+        return stats
@@ -0,0 +1,353 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Row size statistics of exported data files (COPY TO CSV, sstabledump JSON), without a cluster """
+
+import ast
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+from collections import defaultdict
+from itertools import chain
+from decimal import Decimal, InvalidOperation
+from multiprocessing import Pool
+
+from row_estimator_for_apache_cassandra.sizes import (FIXED_WIDTHS, build_sizer, parse_type, text_size,
+                                                      _varint_size, _decimal_size, _inet_size)
+from row_estimator_for_apache_cassandra.stats import StreamingStats
+from row_estimator_for_apache_cassandra.results import RESULT_VERSION
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Start of a partition object in sstabledump output. Quotes inside JSON strings are escaped,
+# so this only matches the "partition" key of a top level object
+_PARTITION_START = re.compile(rb'\{\s*"partition"\s*:')
+
+# Elements of a CQL collection literal such as {'a': 1, 'it''s': 2}
+_CQL_ELEMENT = re.compile(r"'(?:[^']|'')*'|[^,:\[\]{}\s']+")
+
+
+def parse_column_types(spec):
+    """ Parses 'id:int,tags:map<text, int>' into [('id', 'int'), ('tags', 'map<text, int>')] """
+    columns = []
+    depth = 0
+    item = ''
+    for c in spec + ',':
+        if c == ',' and depth == 0:
+            if item.strip():
+                name, _, cql_type = item.partition(':')
+                if not cql_type:
+                    raise ValueError("Column %r has no type, expected name:type" % item.strip())
+                columns.append((name.strip(), cql_type.strip()))
+            item = ''
+            continue
+        depth += {'<': 1, '>': -1}.get(c, 0)
+        item += c
+    return columns
+
+
+def _unfrozen(cql_type):
+    name, subtypes = parse_type(cql_type) if isinstance(cql_type, str) else cql_type
+    if name == 'frozen':
+        name, subtypes = subtypes[0]
+    return name, subtypes
+
+
+def text_sizer(cql_type):
+    """
+        Returns a function that gives the serialized size of a value of cql_type from its exported
+        text form, so offline rows are measured like rows read from the cluster. Empty values are
+        nulls. Collections and UDTs that cannot be parsed are measured by their text length.
+    """
+    name, subtypes = _unfrozen(cql_type)
+    if name in FIXED_WIDTHS:
+        width = FIXED_WIDTHS[name]
+        return lambda t: width if t != '' and t is not None else 0
+    if name in ('ascii', 'text', 'varchar'):
+        return lambda t: text_size(_text(t))
+    if name == 'blob':
+        # Exported as 0x followed by two hex digits per byte
+        return lambda t: max(0, len(_text(t)) - 2) // 2
+    if name == 'varint':
+        return _or_text(lambda t: _varint_size(int(t)))
+    if name == 'decimal':
+        return _or_text(lambda t: _decimal_size(Decimal(t)))
+    if name == 'inet':
+        return lambda t: _inet_size(t) if t else 0
+    if name in ('list', 'set', 'map') and all(not sub for _, sub in subtypes):
+        # Collections of simple types are split with a regular expression, much faster than literal_eval
+        element_sizers = [text_sizer(t) for t in subtypes]
+        return _or_text(lambda t: _flat_collection_size(t, element_sizers))
+    sizer = build_sizer((name, subtypes))
+    return _or_text(lambda t: sizer(t if not isinstance(t, str) else ast.literal_eval(t)))
+
+
+def _flat_collection_size(value, element_sizers):
+    if not isinstance(value, str):
+        raise TypeError(value)
+    elements = [e[1:-1].replace("''", "'") if e.startswith("'") else e for e in _CQL_ELEMENT.findall(value)]
+    if len(element_sizers) == 1:
+        size = element_sizers[0]
+        return sum(size(e) for e in elements)
+    key_size, value_size = element_sizers
+    return sum(key_size(k) + value_size(v) for k, v in zip(elements[::2], elements[1::2]))
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _or_text(size):
+    def sizer(value):
+        if value is None or value == '':
+            return 0
+        try:
+            return size(_text(value) if isinstance(value, (int, float)) else value)
+        except (ValueError, SyntaxError, TypeError, InvalidOperation, AttributeError):
+            return text_size(_text(value))
+    return sizer
+
+
+def file_chunks(paths, chunk_size=CHUNK_SIZE):
+    """ Splits files into (path, start, end) byte ranges of at most chunk_size bytes """
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_size):
+            chunks.append((path, start, min(size, start + chunk_size)))
+    return chunks
+
+
+def csv_chunks(paths, chunk_size=CHUNK_SIZE):
+    """
+        Splits CSV files into (path, start, end) byte ranges of about chunk_size bytes that start
+        at a record. One sequential pass counts the quotes before each candidate start, a line
+        break inside a quoted value moves the start to the next line break outside quotes.
+    """
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = _record_start(mm, start, start + chunk_size)
+                chunks.append((path, start, end))
+                start = end
+    return chunks
+
+
+def _record_start(mm, record, pos):
+    """ The first record start at or after pos, given the record start before it; quotes of a CSV value are doubled """
+    size = len(mm)
+    if pos >= size:
+        return size
+    nl = mm.find(b'\n', pos - 1)
+    if nl == -1:
+        return size
+    quoted = mm[record:nl].count(b'"') % 2
+    while quoted:
+        following = mm.find(b'\n', nl + 1)
+        if following == -1:
+            return size
+        quoted ^= mm[nl:following].count(b'"') % 2
+        nl = following
+    return nl + 1
+
+
+def _csv_lines(mm, start, end):
+    """ Yields the lines of a CSV file in [start, end), start and end are record starts from csv_chunks """
+    pos = start
+    while pos < end:
+        nl = mm.find(b'\n', pos, end)
+        nl = end if nl == -1 else nl + 1
+        yield mm[pos:nl].decode('utf-8')
+        pos = nl
+
+
+def scan_csv_chunk(task):
+    """ Pool task: statistics of the CSV records of one byte range """
+    path, start, end, column_types, header = task
+    sizers = [text_sizer(t) for _, t in column_types] if column_types else None
+    stats = StreamingStats()
+    totals = defaultdict(int)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        records = csv.reader(_csv_lines(mm, start, end))
+        if header and start == 0:
+            next(records, None)
+        for record in records:
+            if sizers is None:
+                sizes = [text_size(v) for v in record]
+            else:
+                sizes = [f(v) for f, v in zip(sizers, record)]
+            stats.add(sum(sizes))
+            for i, size in enumerate(sizes):
+                totals[i] += size
+    return stats.to_dict(), dict(totals)
+
+
+def _partitions(mm, start, end):
+    """ Yields the decoded sstabledump partitions whose object starts in [start, end) """
+    match = _PARTITION_START.search(mm, start)
+    while match is not None and match.start() < end:
+        following = _PARTITION_START.search(mm, match.end())
+        stop = following.start() if following is not None else len(mm)
+        text = mm[match.start():stop].decode('utf-8').rstrip().rstrip(']').rstrip().rstrip(',')
+        yield json.loads(text)
+        match = following
+
+
+def scan_sstabledump_chunk(task):
+    """
+        Pool task: statistics of the rows of the sstabledump partitions starting in one byte range.
+        column_types list the partition key, clustering and regular columns in that order.
+    """
+    path, start, end, column_types, _ = task
+    names = [n for n, _ in column_types or []]
+    sizers = dict((n, text_sizer(t)) for n, t in column_types or [])
+    # Collections are dumped as one cell per element, sized by (key or element, value) sizers
+    element_sizers = {}
+    for n, t in column_types or []:
+        kind, subtypes = _unfrozen(t)
+        if kind in ('set', 'map'):
+            element_sizers[n] = (text_sizer(subtypes[0]), text_sizer(subtypes[1]) if kind == 'map' else None)
+        elif kind == 'list':
+            element_sizers[n] = (None, text_sizer(subtypes[0]))
+    stats = StreamingStats()
+    totals = defaultdict(int)
+
+    def size_of(name, value):
+        return sizers[name](value) if name in sizers else text_size(_text(value))
+
+    def cells_size(cells, row_totals):
+        total = 0
+        for cell in cells:
+            name = cell.get('name')
+            if 'value' not in cell and 'path' not in cell:
+                # Deleted cell or collection tombstone
+                continue
+            if 'path' in cell and name in element_sizers:
+                # The path holds a set element or map key, the value a list element or map value
+                key_sizer, value_sizer = element_sizers[name]
+                size = 0
+                if key_sizer is not None:
+                    size += key_sizer(cell['path'][0])
+                if value_sizer is not None:
+                    size += value_sizer(cell.get('value'))
+            elif 'path' in cell:
+                size = sum(text_size(_text(p)) for p in cell['path']) + text_size(_text(cell.get('value')))
+            else:
+                size = size_of(name, cell.get('value'))
+            row_totals[name] += size
+            total += size
+        return total
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for partition in _partitions(mm, start, end):
+            key = partition['partition'].get('key', [])
+            key_names = names[:len(key)] if len(names) >= len(key) else ['key%d' % i for i in range(len(key))]
+            key_totals = defaultdict(int)
+            key_size = 0
+            for name, value in zip(key_names, key):
+                size = size_of(name, value)
+                key_totals[name] += size
+                key_size += size
+            rows = [r for r in partition.get('rows', []) if r.get('type') == 'row']
+            static_totals = defaultdict(int)
+            static_size = sum(cells_size(r.get('cells', []), static_totals)
+                              for r in partition.get('rows', []) if r.get('type') == 'static_block')
+            if not rows and static_size:
+                # A partition with only static values reads as one row
+                rows = [{}]
+            for row in rows:
+                row_totals = defaultdict(int)
+                clustering = row.get('clustering', [])
+                clustering_names = names[len(key):len(key) + len(clustering)]
+                if len(clustering_names) < len(clustering):
+                    clustering_names = ['clustering%d' % i for i in range(len(clustering))]
+                size = key_size + static_size
+                for name, value in zip(clustering_names, clustering):
+                    column_size = size_of(name, value)
+                    row_totals[name] += column_size
+                    size += column_size
+                size += cells_size(row.get('cells', []), row_totals)
+                stats.add(size)
+                for name, column_size in chain(key_totals.items(), static_totals.items(), row_totals.items()):
+                    totals[name] += column_size
+    return stats.to_dict(), dict(totals)
+
+
+SCANNERS = {'csv': scan_csv_chunk, 'sstabledump': scan_sstabledump_chunk}
+
+
+def estimate_files(paths, file_format, column_types=None, header=False, workers=None, chunk_size=CHUNK_SIZE,
+                   keyspace=None, table=None):
+    """
+        Measures every row of exported files in parallel, returns a result like results.make_result.
+        Files are memory mapped and split into chunk_size byte ranges, each range is parsed by a
+        worker process and the statistics of the ranges are merged in file order.
+    """
+    scan = SCANNERS[file_format]
+    paths = [p for p in paths if os.path.getsize(p) > 0]
+    if header and file_format == 'csv' and paths and not column_types:
+        with open(paths[0], newline='') as f:
+            columns = next(csv.reader(f), [])
+    else:
+        columns = [n for n, _ in column_types or []]
+    chunks = csv_chunks(paths, chunk_size) if file_format == 'csv' else file_chunks(paths, chunk_size)
+    tasks = [(path, start, end, column_types, header) for path, start, end in chunks]
+    logging.info("Reading %s files in %s chunks", len(paths), len(tasks))
+
+    stats = StreamingStats()
+    totals = defaultdict(int)
+    if workers == 1 or len(tasks) <= 1:
+        results = map(scan, tasks)
+        pool = None
+    else:
+        pool = Pool(workers)
+        results = pool.imap(scan, tasks)
+    try:
+        for chunk_stats, chunk_totals in results:
+            stats.merge(StreamingStats.from_dict(chunk_stats))
+            for column, size in chunk_totals.items():
+                totals[column] += size
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if file_format == 'csv':
+        if not columns:
+            columns = ['column%d' % i for i in range(len(totals))]
+        column_totals = [totals.get(i, 0) for i in range(len(columns))]
+    else:
+        columns = columns + sorted(c for c in totals if c not in columns)
+        column_totals = [totals.get(c, 0) for c in columns]
+    return {'version': RESULT_VERSION,
+            'keyspace': keyspace,
+            'table': table,
+            'json': False,
+            'shards': [],
+            'ranges_total': len(tasks),
+            'ranges_completed': len(tasks),
+            'completed_ranges': [],
+            'failed_ranges': [],
+            'columns': columns,
+            'column_names_bytes': sum(text_size(c) for c in columns),
+            'column_totals': column_totals,
+            'row_stats': stats.to_dict()}
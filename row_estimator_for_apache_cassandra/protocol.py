@@ -0,0 +1,72 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Driver protocol handler that measures cells without deserializing them """
+
+import struct
+import time
+
+from cassandra.protocol import _ProtocolHandler, ResultMessage, read_int
+
+_int32 = struct.Struct('>i')
+
+
+class SizeOnlyResultMessage(ResultMessage):
+    """
+        ROWS result whose rows are tuples of cell sizes in bytes, read from the length
+        prefix of each cell in the response buffer. Null and unset cells are 0 bytes.
+    """
+    def recv_results_rows(self, f, protocol_version, user_type_map, result_metadata, *args):
+        self.recv_results_metadata(f, user_type_map)
+        column_metadata = self.column_metadata or result_metadata
+        colcount = len(column_metadata)
+        rowcount = read_int(f)
+        unpack_from = _int32.unpack_from
+        pos = f.tell()
+        rows = []
+        with f.getbuffer() as buf:
+            for _ in range(rowcount):
+                sizes = []
+                for _ in range(colcount):
+                    n = unpack_from(buf, pos)[0]
+                    pos += 4
+                    if n > 0:
+                        pos += n
+                        sizes.append(n)
+                    else:
+                        sizes.append(0)
+                rows.append(tuple(sizes))
+        f.seek(pos)
+        self.column_names = [c[2] for c in column_metadata]
+        self.column_types = [c[3] for c in column_metadata]
+        self.parsed_rows = rows
+
+
+class SizeOnlyProtocolHandler(_ProtocolHandler):
+    """ Protocol handler for sessions that only need the size of sampled rows """
+    message_types_by_opcode = _ProtocolHandler.message_types_by_opcode.copy()
+    message_types_by_opcode[SizeOnlyResultMessage.opcode] = SizeOnlyResultMessage
+
+
+def timed_protocol_handler(handler, metrics):
+    """ Returns a subclass of the protocol handler that adds the time spent decoding responses to metrics """
+    class TimedProtocolHandler(handler):
+        @classmethod
+        def decode_message(cls, *args, **kwargs):
+            started = time.monotonic()
+            try:
+                return super(TimedProtocolHandler, cls).decode_message(*args, **kwargs)
+            finally:
+                metrics.decoded(time.monotonic() - started)
+    return TimedProtocolHandler
@@ -0,0 +1,102 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Result files of sharded runs, and merging them into one result """
+
+import json
+import logging
+
+from row_estimator_for_apache_cassandra.stats import StreamingStats, PartitionStats
+
+RESULT_VERSION = 1
+
+
+def make_result(estimator, as_json=False):
+    """ Returns the result of the last row_sampler run of the estimator as a JSON serializable dict """
+    schema = estimator.get_table_schema()
+    return {'version': RESULT_VERSION,
+            'keyspace': estimator.keyspace,
+            'table': estimator.table,
+            'json': bool(as_json),
+            'shards': [list(estimator.shard)] if estimator.shard else [],
+            'ranges_total': estimator.ranges_total,
+            'ranges_completed': estimator.ranges_completed,
+            'completed_ranges': [list(r) for r in estimator.completed_ranges],
+            'failed_ranges': [list(r) for r in estimator.failed_ranges],
+            'columns': list(schema.columns),
+            'column_names_bytes': estimator.get_total_column_size(),
+            'column_totals': estimator.column_totals,
+            'row_stats': estimator.row_stats.to_dict(),
+            'partition_stats': None if estimator.partition_stats is None else estimator.partition_stats.to_dict()}
+
+
+def write_result(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f)
+
+
+def read_result(path):
+    with open(path) as f:
+        result = json.load(f)
+    if result.get('version') != RESULT_VERSION:
+        raise ValueError("%s is not a result file of version %s" % (path, RESULT_VERSION))
+    return result
+
+
+def merge_results(results):
+    """ Combines the results of the shards of one table into a single result """
+    first = results[0]
+    merged = dict(first)
+    merged['shards'] = []
+    merged['completed_ranges'] = []
+    merged['failed_ranges'] = []
+    merged['ranges_total'] = 0
+    merged['ranges_completed'] = 0
+    merged['column_totals'] = None
+    stats = StreamingStats()
+    partitions = None
+    seen = set()
+    for result in results:
+        for key in ('keyspace', 'table', 'json', 'columns'):
+            if result[key] != first[key]:
+                raise ValueError("Cannot merge results with different %s: %s and %s" % (key, first[key], result[key]))
+        overlap = seen.intersection(tuple(r) for r in result['completed_ranges'])
+        if overlap:
+            raise ValueError("Results overlap in %s token ranges, were the same shards merged twice?" % len(overlap))
+        seen.update(tuple(r) for r in result['completed_ranges'])
+        merged['shards'].extend(result['shards'])
+        merged['completed_ranges'].extend(result['completed_ranges'])
+        merged['failed_ranges'].extend(result['failed_ranges'])
+        merged['ranges_total'] += result['ranges_total']
+        merged['ranges_completed'] += result['ranges_completed']
+        if result['column_totals'] is not None:
+            if merged['column_totals'] is None:
+                merged['column_totals'] = list(result['column_totals'])
+            else:
+                merged['column_totals'] = [a + b for a, b in zip(merged['column_totals'], result['column_totals'])]
+        stats.merge(StreamingStats.from_dict(result['row_stats']))
+        if (result.get('partition_stats') is None) != (first.get('partition_stats') is None):
+            raise ValueError("Cannot merge results with and without partition statistics")
+        if result.get('partition_stats') is not None:
+            shard_partitions = PartitionStats.from_dict(result['partition_stats'])
+            partitions = shard_partitions if partitions is None else partitions.merge(shard_partitions)
+    merged['row_stats'] = stats.to_dict()
+    merged['partition_stats'] = None if partitions is None else partitions.to_dict()
+    shard_counts = set(n for _, n in merged['shards'])
+    if len(shard_counts) == 1:
+        n = shard_counts.pop()
+        missing = sorted(set(range(1, n + 1)) - set(k for k, _ in merged['shards']))
+        if missing:
+            logging.warning("Shards %s of %s are missing from the merge", ','.join(map(str, missing)), n)
+    return merged
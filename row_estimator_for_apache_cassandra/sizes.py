@@ -0,0 +1,154 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Serialized size of Cassandra values, driven by the CQL types in system_schema """
+
+# Encoded width in bytes of the fixed size CQL types
+FIXED_WIDTHS = {
+    'boolean': 1,
+    'tinyint': 1,
+    'smallint': 2,
+    'int': 4,
+    'date': 4,
+    'float': 4,
+    'bigint': 8,
+    'counter': 8,
+    'double': 8,
+    'time': 8,
+    'timestamp': 8,
+    'uuid': 16,
+    'timeuuid': 16,
+}
+
+
+def text_size(value):
+    """ Size of a text value in bytes as it is stored, UTF-8 encoded """
+    if value is None:
+        return 0
+    return len(value.encode('utf-8'))
+
+
+def _blob_size(value):
+    return len(value)
+
+
+def _varint_size(value):
+    # Minimal two's complement encoding, as written by the driver
+    return (int(value).bit_length() + 8) // 8
+
+
+def _decimal_size(value):
+    sign, digits, exponent = value.as_tuple()
+    unscaled = int(''.join(map(str, digits)) or 0)
+    return 4 + _varint_size(unscaled)
+
+
+def _vint_size(value):
+    # Unsigned variable length integer after zig-zag encoding, 1 to 9 bytes
+    value = (value << 1) ^ (value >> 63)
+    return min(9, max(1, (value.bit_length() + 6) // 7))
+
+
+def _duration_size(value):
+    return _vint_size(value.months) + _vint_size(value.days) + _vint_size(value.nanoseconds)
+
+
+def _inet_size(value):
+    return 16 if ':' in str(value) else 4
+
+
+def _str_size(value):
+    return text_size(str(value))
+
+
+_VARIABLE_SIZERS = {
+    'ascii': text_size,
+    'text': text_size,
+    'varchar': text_size,
+    'blob': _blob_size,
+    'varint': _varint_size,
+    'decimal': _decimal_size,
+    'duration': _duration_size,
+    'inet': _inet_size,
+}
+
+
+def parse_type(cql_type):
+    """ Parses a CQL type string such as 'frozen<map<text, list<int>>>' into (name, [subtypes]) """
+    name, subtypes, rest = _parse(cql_type.replace(' ', ''))
+    if rest:
+        raise ValueError("Unexpected %r in CQL type %r" % (rest, cql_type))
+    return name, subtypes
+
+
+def _parse(s):
+    i = 0
+    while i < len(s) and s[i] not in '<>,':
+        i += 1
+    name, s = s[:i].strip('"'), s[i:]
+    subtypes = []
+    if s.startswith('<'):
+        s = s[1:]
+        while True:
+            sub_name, sub_subtypes, s = _parse(s)
+            subtypes.append((sub_name, sub_subtypes))
+            if s.startswith(','):
+                s = s[1:]
+                continue
+            s = s[1:]
+            break
+    return name, subtypes, s
+
+
+def build_sizer(cql_type, user_types=None):
+    """
+        Returns a function that gives the serialized size in bytes of a value of cql_type.
+        user_types maps a UDT name to a list of (field_name, field_type) pairs.
+        Null values are 0 bytes.
+    """
+    if isinstance(cql_type, str):
+        cql_type = parse_type(cql_type)
+    return _build(cql_type, user_types or {})
+
+
+def _build(parsed, user_types):
+    name, subtypes = parsed
+
+    if name == 'frozen':
+        return _build(subtypes[0], user_types)
+
+    if name in FIXED_WIDTHS:
+        width = FIXED_WIDTHS[name]
+        return lambda v: 0 if v is None else width
+
+    if name in _VARIABLE_SIZERS:
+        size = _VARIABLE_SIZERS[name]
+        return lambda v: 0 if v is None else size(v)
+
+    if name in ('list', 'set', 'vector'):
+        element = _build(subtypes[0], user_types)
+        return lambda v: 0 if v is None else sum(map(element, v))
+
+    if name == 'map':
+        key, val = _build(subtypes[0], user_types), _build(subtypes[1], user_types)
+        return lambda v: 0 if v is None else sum(key(k) + val(x) for k, x in v.items())
+
+    if name == 'tuple' or name in user_types:
+        if name in user_types:
+            subtypes = [parse_type(t) for _, t in user_types[name]]
+        fields = [_build(t, user_types) for t in subtypes]
+        return lambda v: 0 if v is None else sum(f(x) for f, x in zip(fields, v))
+
+    # Custom or unknown types are measured by their text form
+    return lambda v: 0 if v is None else _str_size(v)
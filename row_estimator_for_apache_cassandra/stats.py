@@ -0,0 +1,331 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Constant memory statistics of sampled row sizes """
+
+import heapq
+import math
+import random
+from statistics import NormalDist
+
+
+class KLLSketch(object):
+    """
+        Mergeable quantile sketch (Karnin, Lang, Liberty). Values are kept in a stack of
+        compactors, an item in compactor h stands for 2**h input values. Memory is
+        O(k log(n/k)) and the rank error is roughly 1.7/k.
+    """
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """ Adds the values summarised by another sketch """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for h, items in enumerate(other.compactors):
+            self.compactors[h].extend(items)
+        self.n += other.n
+        self._size = sum(len(c) for c in self.compactors)
+        self._max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+        while self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for h in range(len(self.compactors)):
+            if len(self.compactors[h]) >= self._capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self.compactors.append([])
+                items = sorted(self.compactors[h])
+                # An odd item out stays at this level so the total weight is preserved
+                keep = items[:len(items) % 2]
+                pairs = items[len(keep):]
+                self.compactors[h] = keep
+                self.compactors[h + 1].extend(pairs[self._rng.random() < 0.5::2])
+                break
+        self._size = sum(len(c) for c in self.compactors)
+        self._max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def quantile(self, q):
+        """ Returns the value at rank floor(q*n), exact while no compaction has happened """
+        if self.n == 0:
+            return None
+        weighted = sorted((v, 1 << h) for h, items in enumerate(self.compactors) for v in items)
+        rank = math.floor(q * self.n)
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative > rank:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'compactors': [list(c) for c in self.compactors]}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d['k'])
+        sketch.n = d['n']
+        sketch.compactors = [list(c) for c in d['compactors']]
+        sketch._size = sum(len(c) for c in sketch.compactors)
+        sketch._max_size = sum(sketch._capacity(h) for h in range(len(sketch.compactors)))
+        return sketch
+
+
+class StreamingStats(object):
+    """
+        Count, sum, min, max, Welford mean/variance and a quantile sketch of a stream of
+        row sizes. Memory does not depend on the number of values, two accumulators can be
+        merged as if their values had been added one after another.
+    """
+    def __init__(self, k=200):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        # Sum of (position * value), the positional weights used by Estimator.weighted_mean
+        self._weighted_total = 0.0
+        self.sketch = KLLSketch(k)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self._weighted_total += self.count * value
+        self.sketch.update(value)
+
+    def merge(self, other):
+        """ Adds the values of another accumulator, as if they came after the values of this one """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self._weighted_total += other._weighted_total + self.count * other.total
+        self.count = count
+        self.total += other.total
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def variance(self):
+        """ Sample variance """
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def weighted_mean(self):
+        if self.count == 0:
+            return 0.0
+        return self._weighted_total / (self.count * (self.count + 1) / 2.0)
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'mean': self.mean, 'm2': self._m2, 'weighted_total': self._weighted_total,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.count = d['count']
+        stats.total = d['total']
+        stats.min = d['min']
+        stats.max = d['max']
+        stats.mean = d['mean']
+        stats._m2 = d['m2']
+        stats._weighted_total = d['weighted_total']
+        stats.sketch = KLLSketch.from_dict(d['sketch'])
+        return stats
+
+
+def format_partition_key(key):
+    """ Text form of a partition key value, or of a tuple of them for composite keys """
+    values = key if isinstance(key, tuple) else (key,)
+    return ':'.join('0x' + v.hex() if isinstance(v, (bytes, bytearray)) else str(v) for v in values)
+
+
+class PartitionStats(object):
+    """
+        Rows and bytes per partition as streaming statistics, and the top_k partitions with
+        the most bytes together with the write units (one per started KB of a row) it takes
+        to write them. Memory does not depend on the number of partitions. A truncated
+        partition was not known to be read to the end, its sizes are lower bounds.
+    """
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.rows = StreamingStats()
+        self.bytes = StreamingStats()
+        self.truncated = 0
+        # Min-heap of (bytes, rows, write_units, key, truncated)
+        self._largest = []
+
+    @property
+    def count(self):
+        return self.rows.count
+
+    def add(self, key, rows, nbytes, write_units, truncated=False):
+        self.rows.add(rows)
+        self.bytes.add(nbytes)
+        if truncated:
+            self.truncated += 1
+        if len(self._largest) < self.top_k:
+            heapq.heappush(self._largest, (nbytes, rows, write_units, format_partition_key(key), truncated))
+        elif self.top_k and nbytes > self._largest[0][0]:
+            heapq.heapreplace(self._largest, (nbytes, rows, write_units, format_partition_key(key), truncated))
+
+    def merge(self, other):
+        self.rows.merge(other.rows)
+        self.bytes.merge(other.bytes)
+        self.truncated += other.truncated
+        for entry in other._largest:
+            if len(self._largest) < self.top_k:
+                heapq.heappush(self._largest, entry)
+            elif self.top_k and entry > self._largest[0]:
+                heapq.heapreplace(self._largest, entry)
+        return self
+
+    def largest(self):
+        """ The top_k partitions, largest first, as dicts """
+        return [{'key': key, 'rows': rows, 'bytes': nbytes, 'write_units': write_units, 'truncated': truncated}
+                for nbytes, rows, write_units, key, truncated in sorted(self._largest, reverse=True)]
+
+    def to_dict(self):
+        return {'top_k': self.top_k, 'rows': self.rows.to_dict(), 'bytes': self.bytes.to_dict(),
+                'truncated': self.truncated, 'largest': self.largest()}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d['top_k'])
+        stats.rows = StreamingStats.from_dict(d['rows'])
+        stats.bytes = StreamingStats.from_dict(d['bytes'])
+        stats.truncated = d['truncated']
+        stats._largest = [(p['bytes'], p['rows'], p['write_units'], p['key'], p['truncated']) for p in d['largest']]
+        heapq.heapify(stats._largest)
+        return stats
+
+
+class ConvergenceMonitor(object):
+    """
+        Tracks how well the sampled mean and percentiles are known. Rows of a token range are
+        correlated, so every range is one sample unit: the mean is a ratio estimator over ranges
+        and percentile intervals use the effective sample size implied by its design effect.
+    """
+    def __init__(self, target_relative_error, confidence=0.95, quantiles=(0.5, 0.9, 0.99), min_ranges=10):
+        self.target_relative_error = target_relative_error
+        self.confidence = confidence
+        self.quantiles = quantiles
+        self.min_ranges = min_ranges
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+        self.ranges = 0
+        # Sums over ranges of rows (x) and bytes (y) needed for the ratio estimator variance
+        self._x = 0
+        self._y = 0
+        self._xx = 0
+        self._yy = 0
+        self._xy = 0
+
+    def add_range(self, count, total):
+        self.ranges += 1
+        self._x += count
+        self._y += total
+        self._xx += count * count
+        self._yy += total * total
+        self._xy += count * total
+
+    def mean_standard_error(self):
+        m = self.ranges
+        if m < 2 or self._x == 0:
+            return float('inf')
+        r = float(self._y) / self._x
+        residuals = max(0.0, self._yy - 2 * r * self._xy + r * r * self._xx)
+        mean_x = float(self._x) / m
+        return math.sqrt(residuals / (m * (m - 1))) / mean_x
+
+    def relative_errors(self, stats):
+        """ Returns {'mean': e, q: e, ...}, the half width of each confidence interval relative to its estimate """
+        errors = {}
+        se = self.mean_standard_error()
+        errors['mean'] = _relative(self.z * se, stats.mean)
+        if stats.count < 2:
+            for q in self.quantiles:
+                errors[q] = float('inf')
+            return errors
+        # Design effect of range sampling compared to a simple random sample of rows
+        srs_variance = stats.variance / stats.count
+        design_effect = max(1.0, se * se / srs_variance) if srs_variance > 0 else 1.0
+        effective_n = stats.count / design_effect
+        for q in self.quantiles:
+            d = self.z * math.sqrt(q * (1 - q) / effective_n)
+            low, high = stats.quantile(max(0.0, q - d)), stats.quantile(min(1.0, q + d))
+            errors[q] = _relative((high - low) / 2.0, stats.quantile(q))
+        return errors
+
+    def to_dict(self):
+        return {'ranges': self.ranges, 'x': self._x, 'y': self._y, 'xx': self._xx, 'yy': self._yy, 'xy': self._xy}
+
+    def load(self, d):
+        """ Restores the ranges added before, see to_dict """
+        self.ranges = d['ranges']
+        self._x, self._y = d['x'], d['y']
+        self._xx, self._yy, self._xy = d['xx'], d['yy'], d['xy']
+
+    def converged(self, stats):
+        if self.ranges < self.min_ranges:
+            return False
+        return all(e <= self.target_relative_error for e in self.relative_errors(stats).values())
+
+
+def _relative(half_width, estimate):
+    if half_width == 0:
+        return 0.0
+    if not estimate or math.isinf(half_width):
+        return float('inf')
+    return abs(half_width / float(estimate))
@@ -0,0 +1,111 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+""" Load control of range queries, so sampling backs off when the cluster is busy """
+
+import math
+import time
+from threading import Lock
+
+
+class AIMDController(object):
+    """
+        Additive increase, multiplicative decrease of the number of queries in flight.
+        Latencies are collected in rounds of at least round_size queries: the limit grows
+        while the P99 of a round stays under target_p99_ms and is cut by decrease when it
+        does not, or at once when the cluster reports a timeout or overload. Until the
+        first cut the limit doubles every round, like TCP slow start. Errors of queries sent
+        before the last cut cut no further, so a burst of errors cuts once per window.
+    """
+    def __init__(self, target_p99_ms, max_limit, min_limit=1, decrease=0.5, round_size=20, clock=time.monotonic):
+        self.target_p99_ms = target_p99_ms
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.decrease = decrease
+        self.round_size = round_size
+        self.limit = self.min_limit
+        self.slow_start = True
+        self.increases = 0
+        self.decreases = 0
+        self._latencies = []
+        self._clock = clock
+        self._cut_at = None
+        self._lock = Lock()
+
+    def record(self, latency_ms):
+        """ Adds the latency of a query, returns the new limit when it changes, otherwise None """
+        with self._lock:
+            self._latencies.append(latency_ms)
+            if len(self._latencies) < max(self.round_size, self.limit):
+                return None
+            latencies = sorted(self._latencies)
+            self._latencies = []
+            p99 = latencies[min(len(latencies) - 1, int(math.ceil(0.99 * len(latencies))) - 1)]
+            if p99 > self.target_p99_ms:
+                return self._cut()
+            if self.limit >= self.max_limit:
+                return None
+            self.limit = min(self.max_limit, self.limit * 2 if self.slow_start else self.limit + 1)
+            self.increases += 1
+            return self.limit
+
+    def overloaded(self, sent_at=None):
+        """
+            A query sent at sent_at (on the clock of the controller) timed out or the coordinator
+            was overloaded. Returns the new limit, or None when the query was sent before the last cut.
+        """
+        with self._lock:
+            if sent_at is not None and self._cut_at is not None and sent_at < self._cut_at:
+                return None
+            # Queries of the current round were sent at the old limit, they do not count
+            self._latencies = []
+            return self._cut()
+
+    def _cut(self):
+        self.slow_start = False
+        self.limit = max(self.min_limit, int(self.limit * self.decrease))
+        self.decreases += 1
+        self._cut_at = self._clock()
+        return self.limit
+
+
+class RateLimiter(object):
+    """
+        Token bucket of rows per second. Rows are paid after they arrive, a request has to
+        wait until the rows of earlier pages are paid for. The bucket holds one second of rows.
+    """
+    def __init__(self, rows_per_sec, clock=time.monotonic):
+        self.rate = float(rows_per_sec)
+        self._clock = clock
+        self._tokens = self.rate
+        self._at = clock()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.rate, self._tokens + (now - self._at) * self.rate)
+        self._at = now
+
+    def consume(self, rows):
+        with self._lock:
+            self._refill()
+            self._tokens -= rows
+
+    def delay(self):
+        """ Seconds to wait before the next request """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
@@ -0,0 +1,208 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+"""
+    Benchmarks of row_sampler in every sampling mode and of the list helpers, on the fake
+    cluster of fake_cluster.py. Reports rows/sec, CPU per row and peak traced memory.
+
+        python test/benchmark.py --save baseline.json
+        python test/benchmark.py --compare baseline.json --tolerance 0.25
+
+    CPU time is that of the whole process, so it includes the fake cluster handing out pages,
+    which stands in for the driver decoding them.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+# Run as a script from anywhere in the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_cluster import FakeCluster, FakeTable, attach
+from row_estimator_for_apache_cassandra.estimator import Estimator
+
+# Mode name -> (Estimator settings, json)
+MODES = {
+    'ring': ({'sampling': 'ring'}, False),
+    'stratified': ({'sampling': 'stratified'}, False),
+    'weighted': ({'sampling': 'weighted'}, False),
+    'adaptive': ({'sampling': 'stratified', 'target_relative_error': 0.01}, False),
+    'replica': ({'routing': 'replica'}, False),
+    'wire-sizes': ({'wire_sizes': True, 'per_column': True}, False),
+    'json': ({}, True),
+    'partitions': ({'aggregate_partitions': True}, False),
+}
+
+HELPERS = ('weighted_mean', 'quartiles', 'total_size')
+
+
+def benchmark_table(partitions, seed=0):
+    """ Wide-ish rows with skewed text, blob and collection sizes, 1 to 8 rows per partition """
+    columns = [('id', 'int'), ('seq', 'int'), ('name', 'text'), ('payload', 'blob'), ('tags', 'set<text>'),
+               ('attrs', 'map<text, int>'), ('score', 'double'), ('created', 'timestamp')]
+    lengths = {'name': ('lognormal', 3, 0.7), 'payload': ('pareto', 1.5, 64), 'tags': ('uniform', 0, 6),
+               'attrs': ('uniform', 0, 4)}
+    return FakeTable('bench', 'events', columns, partition_key=['id'], clustering_key=['seq'], partitions=partitions,
+                     rows_per_partition=('uniform', 1, 8), lengths=lengths, null_rate=0.05, seed=seed)
+
+
+def run_mode(cluster, mode, args, trace_memory=False):
+    """ Samples the benchmark table once, returns rows, seconds and CPU seconds, and the peak traced memory """
+    settings, as_json = MODES[mode]
+    estimator = Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1, seed=1,
+                          rows_per_request=args.rows_per_request, pagination=args.pagination,
+                          concurrency=args.concurrency, **settings)
+    attach(estimator, cluster)
+    # Schema lookups are not what is measured
+    estimator.get_table_schema()
+    if trace_memory:
+        tracemalloc.start()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    estimator.row_sampler(json=as_json)
+    seconds, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rows = estimator.row_stats.count
+    estimator.close()
+    return rows, seconds, cpu, peak
+
+
+def bench_mode(cluster, mode, args):
+    rows, seconds, cpu = 0, float('inf'), float('inf')
+    for _ in range(args.repeat):
+        rows, s, c, _ = run_mode(cluster, mode, args)
+        seconds, cpu = min(seconds, s), min(cpu, c)
+    result = {'rows': rows, 'seconds': seconds, 'rows_per_sec': rows / seconds if seconds else 0.0,
+              'cpu_us_per_row': cpu * 1e6 / rows if rows else 0.0, 'peak_mib': None}
+    if not args.no_memory:
+        # A separate run, tracemalloc slows allocations down
+        result['peak_mib'] = run_mode(cluster, mode, args, trace_memory=True)[3] / 2.0**20
+    return result
+
+
+def bench_helpers(table, args):
+    """ Microseconds per list element of the Estimator list helpers, on the sizes of the table rows """
+    estimator = Estimator('127.0.0.1', 9042)
+    sizes = [sum(s) for s in table.cell_sizes[:args.helper_items]]
+    rows = table.rows[:args.helper_items]
+    calls = {
+        'weighted_mean': lambda: estimator.weighted_mean(sizes),
+        # quartiles sorts its argument
+        'quartiles': lambda: estimator.quartiles(list(sizes), 0.9),
+        'total_size': lambda: estimator.total_size(rows),
+    }
+    results = {}
+    for name in HELPERS:
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            calls[name]()
+            best = min(best, time.perf_counter() - started)
+        results[name] = {'items': len(sizes), 'us_per_item': best * 1e6 / len(sizes)}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Returns the metrics that got worse than baseline by more than tolerance, as messages """
+    regressions = []
+    for mode, now in results['modes'].items():
+        before = baseline.get('modes', {}).get(mode)
+        if not before:
+            continue
+        if now['rows_per_sec'] < before['rows_per_sec'] * (1 - tolerance):
+            regressions.append("%s: %.0f rows/sec, was %.0f" % (mode, now['rows_per_sec'], before['rows_per_sec']))
+        for metric in ('cpu_us_per_row', 'peak_mib'):
+            if now.get(metric) is not None and before.get(metric) and now[metric] > before[metric] * (1 + tolerance):
+                regressions.append("%s: %s %.2f, was %.2f" % (mode, metric, now[metric], before[metric]))
+    for name, now in results['helpers'].items():
+        before = baseline.get('helpers', {}).get(name)
+        if before and now['us_per_item'] > before['us_per_item'] * (1 + tolerance):
+            regressions.append("%s: %.3f us/item, was %.3f" % (name, now['us_per_item'], before['us_per_item']))
+    return regressions
+
+
+def run(args):
+    table = benchmark_table(args.partitions, args.seed)
+    if 'json' in args.modes:
+        # Made once and kept by the table, so the first JSON run does not pay for it
+        table.json_rows()
+    cluster = FakeCluster([table], nodes=args.nodes, vnodes=args.vnodes, latency=args.latency_ms / 1000.0,
+                          seed=args.seed)
+    results = {'rows_in_table': len(table.rows), 'modes': {}, 'helpers': {}}
+    for mode in args.modes:
+        results['modes'][mode] = bench_mode(cluster, mode, args)
+    if not args.no_helpers:
+        results['helpers'] = bench_helpers(table, args)
+    cluster.shutdown()
+    return results
+
+
+def print_results(results):
+    print("%d rows in the table, peak RSS %.1f MiB" % (results['rows_in_table'],
+                                                      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    print("%-12s %9s %9s %12s %12s %10s" % ('mode', 'rows', 'seconds', 'rows/sec', 'cpu us/row', 'peak MiB'))
+    for mode, r in results['modes'].items():
+        peak = '-' if r['peak_mib'] is None else '%.2f' % r['peak_mib']
+        print("%-12s %9d %9.3f %12.0f %12.2f %10s" % (mode, r['rows'], r['seconds'], r['rows_per_sec'],
+                                                     r['cpu_us_per_row'], peak))
+    for name, r in results['helpers'].items():
+        print("%-14s %9d items %9.3f us/item" % (name, r['items'], r['us_per_item']))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the row estimator on an in-process fake cluster')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES), help='Sampling modes to run')
+    parser.add_argument('--partitions', type=int, default=20000, help='Partitions of the benchmark table')
+    parser.add_argument('--nodes', type=int, default=3, help='Nodes of the fake cluster')
+    parser.add_argument('--vnodes', type=int, default=16, help='Tokens per node')
+    parser.add_argument('--rows-per-request', type=int, default=1000, help='Rows read from each token range')
+    parser.add_argument('--pagination', type=int, default=500, help='Page size of the range queries')
+    parser.add_argument('--concurrency', type=int, default=4, help='Token ranges read at the same time')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Simulated latency of every page')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, the best one is reported')
+    parser.add_argument('--helper-items', type=int, default=20000, help='List length for the list helpers')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the table and the ring')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc runs')
+    parser.add_argument('--no-helpers', action='store_true', help='Skip the list helper benchmarks')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file, exit with 1 when a metric is worse by more than the tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression, default 0.25')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
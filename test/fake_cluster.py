@@ -0,0 +1,637 @@
+#Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+#Licensed under the Apache License, Version 2.0 (the "License").
+#You may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+"""
+    In-process stand-in for a Cassandra cluster, so the estimator can be tested and
+    benchmarked without a database. It answers the queries the estimator sends:
+    system_schema.columns, .types and .tables, system.size_estimates and token range
+    queries, over a synthetic token ring and seeded synthetic tables.
+"""
+
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from decimal import Decimal
+from threading import Condition, Lock, Thread
+
+from cassandra import InvalidRequest, ReadTimeout
+from cassandra.cqltypes import _cqltypes
+
+from row_estimator_for_apache_cassandra.estimator import MIN_TOKEN, MAX_TOKEN
+from row_estimator_for_apache_cassandra.sizes import build_sizer, parse_type, text_size
+
+ColumnRow = namedtuple('ColumnRow', ['column_name', 'kind', 'position', 'type'])
+TypeRow = namedtuple('TypeRow', ['type_name', 'field_names', 'field_types'])
+TableRow = namedtuple('TableRow', ['table_name'])
+EstimateRow = namedtuple('EstimateRow', ['range_start', 'range_end', 'partitions_count', 'mean_partition_size'])
+JsonRow = namedtuple('JsonRow', ['json'])
+
+# Random text that generated strings are cut from, cheaper than drawing every character
+_TEXT = ''.join(random.Random(0).choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(1 << 16))
+# Length of the elements of collections and of nested values
+_ELEMENT_LENGTH = 8
+_INTEGER_TYPES = ('tinyint', 'smallint', 'int', 'bigint', 'varint', 'counter')
+# A CQL identifier, unquoted or in double quotes
+_NAME = r'"(?:[^"]|"")+"|\w+'
+
+
+def draw_length(rnd, spec):
+    """
+        Draws a non-negative length from spec: an int, ('fixed', n), ('uniform', low, high),
+        ('lognormal', mu, sigma) or ('pareto', alpha, scale)
+    """
+    if isinstance(spec, int):
+        return spec
+    kind, args = spec[0], spec[1:]
+    if kind == 'fixed':
+        return args[0]
+    if kind == 'uniform':
+        return rnd.randint(args[0], args[1])
+    if kind == 'lognormal':
+        return int(rnd.lognormvariate(args[0], args[1]))
+    if kind == 'pareto':
+        return int(args[1] * rnd.paretovariate(args[0]))
+    raise ValueError("Unknown length distribution %r" % (spec,))
+
+
+def _text(rnd, n):
+    if n > len(_TEXT):
+        return (_TEXT * (n // len(_TEXT) + 1))[:n]
+    start = rnd.randrange(len(_TEXT) - n + 1)
+    return _TEXT[start:start + n]
+
+
+def _blob(rnd, n):
+    return rnd.getrandbits(8 * n).to_bytes(n, 'big') if n else b''
+
+
+_SCALARS = {
+    'boolean': lambda rnd, n: rnd.random() < 0.5,
+    'tinyint': lambda rnd, n: rnd.randrange(-2**7, 2**7),
+    'smallint': lambda rnd, n: rnd.randrange(-2**15, 2**15),
+    'int': lambda rnd, n: rnd.randrange(-2**31, 2**31),
+    'bigint': lambda rnd, n: rnd.randrange(-2**63, 2**63),
+    'counter': lambda rnd, n: rnd.randrange(2**31),
+    'varint': lambda rnd, n: rnd.getrandbits(8 * max(1, n) - 1),
+    'float': lambda rnd, n: rnd.random(),
+    'double': lambda rnd, n: rnd.random(),
+    'decimal': lambda rnd, n: Decimal(rnd.getrandbits(8 * max(1, n) - 1)).scaleb(-2),
+    'date': lambda rnd, n: datetime.date(2020, 1, 1) + datetime.timedelta(days=rnd.randrange(3650)),
+    'time': lambda rnd, n: rnd.randrange(86400 * 10**9),
+    'timestamp': lambda rnd, n: datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=rnd.randrange(10**8)),
+    'uuid': lambda rnd, n: uuid.UUID(int=rnd.getrandbits(128)),
+    'timeuuid': lambda rnd, n: uuid.UUID(int=rnd.getrandbits(128)),
+    'inet': lambda rnd, n: '10.%d.%d.%d' % (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)),
+    'ascii': _text,
+    'text': _text,
+    'varchar': _text,
+    'blob': _blob,
+}
+
+
+def value_maker(cql_type):
+    """
+        Returns a function (rnd, n) -> value of cql_type, n is the length of text and blobs,
+        the number of elements of collections and the byte length of varints and decimals
+    """
+    return _maker(parse_type(cql_type) if isinstance(cql_type, str) else cql_type)
+
+
+def _maker(parsed):
+    name, subtypes = parsed
+    if name == 'frozen':
+        return _maker(subtypes[0])
+    if name in _SCALARS:
+        return _SCALARS[name]
+    if name in ('list', 'vector'):
+        element = _maker(subtypes[0])
+        return lambda rnd, n: [element(rnd, _ELEMENT_LENGTH) for _ in range(n)]
+    if name == 'set':
+        element = _maker(subtypes[0])
+        return lambda rnd, n: set(element(rnd, _ELEMENT_LENGTH) for _ in range(n))
+    if name == 'map':
+        key, val = _maker(subtypes[0]), _maker(subtypes[1])
+        return lambda rnd, n: dict((key(rnd, _ELEMENT_LENGTH), val(rnd, _ELEMENT_LENGTH)) for _ in range(n))
+    if name == 'tuple':
+        fields = [_maker(t) for t in subtypes]
+        return lambda rnd, n: tuple(f(rnd, _ELEMENT_LENGTH) for f in fields)
+    # Custom types are generated as text
+    return _text
+
+
+def wire_sizer(cql_type):
+    """
+        Returns a function value -> length of the cell as the driver serializes it, with the
+        element count and length prefixes of collections. Nulls and empty collections that
+        are not frozen are stored as nulls, 0 bytes. Custom types are sized as text.
+    """
+    parsed = parse_type(cql_type)
+    wire_type = _wire_type(parsed)
+    if wire_type is None:
+        return build_sizer(cql_type)
+    empty_is_null = parsed[0] in ('list', 'set', 'map')
+
+    def size(value):
+        if value is None or (empty_is_null and not value):
+            return 0
+        return len(wire_type.serialize(value, 4))
+    return size
+
+
+def _wire_type(parsed):
+    name, subtypes = parsed
+    if name not in _cqltypes:
+        return None
+    if not subtypes:
+        return _cqltypes[name]
+    parameters = [_wire_type(t) for t in subtypes]
+    if None in parameters:
+        return None
+    return _cqltypes[name].apply_parameters(parameters)
+
+
+def _unquote(name):
+    """ Column or table name of a CQL identifier: quoted names keep their case, others are lower case """
+    if name.startswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name.lower()
+
+
+def _json_value(value):
+    """ Converts a generated value the way Cassandra writes it in SELECT JSON """
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    if isinstance(value, (list, set, tuple)):
+        return [_json_value(v) for v in value]
+    if isinstance(value, dict):
+        return dict((str(_json_value(k)), _json_value(v)) for k, v in value.items())
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def token_of(key):
+    """ Token of a partition key tuple, stable across runs like Murmur3 but not equal to it """
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).digest()
+    return max(MIN_TOKEN + 1, int.from_bytes(digest, 'big', signed=True))
+
+
+class FakeTable(object):
+    """
+        Table of synthetic rows. columns is a list of (name, cql_type). Rows are either given
+        in rows, as tuples in column order, or generated from seed: partitions partitions of
+        rows_per_partition rows, with the length of variable size columns drawn from the
+        distribution in lengths[column] (see draw_length). Integer key columns are numbered,
+        so partition keys and clustering keys are unique.
+    """
+    def __init__(self, keyspace, name, columns, partition_key, clustering_key=(), rows=None, partitions=1000,
+                 rows_per_partition=1, lengths=None, null_rate=0.0, seed=0):
+        self.keyspace = keyspace
+        self.name = name
+        self.columns = [c for c, _ in columns]
+        self.column_types = dict(columns)
+        self.partition_key = list(partition_key)
+        self.clustering_key = list(clustering_key)
+        self.key_indexes = key_indexes = [self.columns.index(c) for c in self.partition_key]
+        if rows is None:
+            rows = self._generate(partitions, rows_per_partition, lengths or {}, null_rate, random.Random(seed))
+        keyed = sorted(((token_of(tuple(row[i] for i in key_indexes)), n, tuple(row)) for n, row in enumerate(rows)),
+                       key=lambda r: (r[0], r[1]))
+        # Rows in token order, as a range scan returns them
+        self.tokens = [t for t, _, _ in keyed]
+        self.rows = [row for _, _, row in keyed]
+        sizers = [wire_sizer(self.column_types[c]) for c in self.columns]
+        # Cell sizes as SizeOnlyProtocolHandler reads them from the wire
+        self.cell_sizes = [tuple(f(v) for f, v in zip(sizers, row)) for row in self.rows]
+        self._row_types = {}
+        self._json = None
+
+    def _generate(self, partitions, rows_per_partition, lengths, null_rate, rnd):
+        makers = [value_maker(self.column_types[c]) for c in self.columns]
+        keys = set(self.partition_key) | set(self.clustering_key)
+        numbered = [i for i, c in enumerate(self.columns) if c in keys and self.column_types[c] in _INTEGER_TYPES]
+        primary = [self.columns.index(c) for c in self.partition_key]
+        clustering = set(self.columns.index(c) for c in self.clustering_key)
+        length_specs = [lengths.get(c, ('uniform', 0, 32)) for c in self.columns]
+        rows = []
+        for p in range(partitions):
+            key = dict((i, makers[i](rnd, draw_length(rnd, length_specs[i]))) for i in primary)
+            for n in range(max(1, draw_length(rnd, rows_per_partition)) if self.clustering_key else 1):
+                row = []
+                for i, make in enumerate(makers):
+                    if i in key:
+                        value = p if i in numbered else key[i]
+                    elif i in clustering and i in numbered:
+                        value = n
+                    elif i not in clustering and null_rate and rnd.random() < null_rate:
+                        value = None
+                    else:
+                        value = make(rnd, draw_length(rnd, length_specs[i]))
+                    row.append(value)
+                rows.append(tuple(row))
+        return rows
+
+    def partition_rows(self, key):
+        """ (first, stop) indexes of the rows of the partition with the key tuple """
+        token = token_of(key)
+        lo, hi = bisect_left(self.tokens, token), bisect_right(self.tokens, token)
+        matches = [i for i in range(lo, hi) if tuple(self.rows[i][j] for j in self.key_indexes) == key]
+        if not matches:
+            return lo, lo
+        return matches[0], matches[-1] + 1
+
+    def row_type(self, columns):
+        if columns not in self._row_types:
+            self._row_types[columns] = namedtuple('Row', columns)
+        return self._row_types[columns]
+
+    def json_rows(self):
+        """ The rows as SELECT JSON returns them, made on first use """
+        if self._json is None:
+            self._json = [json.dumps(dict((c, _json_value(v)) for c, v in zip(self.columns, row)), separators=(', ', ': '))
+                          for row in self.rows]
+        return self._json
+
+    def partition_estimates(self, start, end):
+        """ (partitions, mean partition size) of the rows in (start, end], like system.size_estimates """
+        lo, hi = bisect_right(self.tokens, start), bisect_right(self.tokens, end)
+        sizes = {}
+        for i in range(lo, hi):
+            sizes[self.tokens[i]] = sizes.get(self.tokens[i], 0) + sum(self.cell_sizes[i])
+        if not sizes:
+            return 0, 0
+        return len(sizes), sum(sizes.values()) // len(sizes)
+
+
+class FakeToken(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return 'FakeToken(%s)' % self.value
+
+
+class FakeHost(object):
+    def __init__(self, address, datacenter):
+        self.address = address
+        self.endpoint = address
+        self.datacenter = datacenter
+        self.is_up = True
+
+    def __repr__(self):
+        return self.address
+
+
+class FakeTokenMap(object):
+    """ Ring of vnode tokens, owned by the hosts in turn, with SimpleStrategy replicas """
+    def __init__(self, tokens, owners, replication_factor):
+        self.ring = [FakeToken(t) for t in tokens]
+        self.token_class = FakeToken
+        self._values = list(tokens)
+        self._owners = owners
+        self.replication_factor = replication_factor
+
+    def get_replicas(self, keyspace, token):
+        i = bisect_left(self._values, token.value) % len(self._values)
+        replicas = []
+        for j in itertools.chain(range(i, len(self._owners)), range(i)):
+            if self._owners[j] not in replicas:
+                replicas.append(self._owners[j])
+                if len(replicas) == self.replication_factor:
+                    break
+        return replicas
+
+
+class FakeMetadata(object):
+    def __init__(self, token_map, hosts):
+        self.token_map = token_map
+        self._hosts = hosts
+
+    def all_hosts(self):
+        return list(self._hosts)
+
+
+class _EventLoop(object):
+    """ One thread that runs the page callbacks, like the connection event loop of the driver """
+    def __init__(self):
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = Condition()
+        self._stopped = False
+        self._thread = Thread(target=self._run, name='fake-cluster-loop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call_later(self, delay, fn, *args):
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), fn, args))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._stopped:
+                    return
+                _, _, fn, args = heapq.heappop(self._queue)
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception("Callback of the fake cluster failed")
+
+
+class FakeStatement(object):
+    """ Prepared statement, kind is 'columns', 'types', 'tables', 'size_estimates', 'range' or 'partition' """
+    def __init__(self, query, kind, table=None, columns=None, json=False):
+        self.query = query
+        self.kind = kind
+        self.table = table
+        self.columns = columns
+        self.json = json
+        self.consistency_level = None
+        self.fetch_size = None
+
+
+class FakeFuture(object):
+    """
+        ResponseFuture of a token range query. Pages arrive on the event loop after the
+        simulated latency; callbacks added after a page arrived are called at once.
+    """
+    def __init__(self, session, statement, pos, stop, host=None):
+        self.session = session
+        self.statement = statement
+        self.host = host
+        self.has_more_pages = False
+        self._paging_state = None
+        self._pos = pos
+        self._stop = stop
+        self._callbacks = None
+        self._result = None
+        self._lock = Lock()
+        self._request_page()
+
+    def _request_page(self):
+        cluster = self.session.cluster
+        fetch_size = self.statement.fetch_size or 5000
+        end = min(self._pos + fetch_size, self._stop)
+        cluster.page_sent(self.host)
+        cluster.loop.call_later(cluster.page_latency(end - self._pos), self._deliver, end, cluster.page_fails())
+
+    def _deliver(self, end, fails):
+        self.session.cluster.page_done(self.host)
+        if fails:
+            result = (None, ReadTimeout("Operation timed out (fake)", consistency=self.statement.consistency_level,
+                                        required_responses=1, received_responses=0))
+        else:
+            result = (self.session.page(self.statement, self._pos, end), None)
+            self._pos = end
+            self.has_more_pages = end < self._stop
+            self._paging_state = (end, self._stop) if self.has_more_pages else None
+        with self._lock:
+            self._result = result
+            callbacks = self._callbacks
+        if callbacks is not None:
+            self._call(callbacks, result)
+
+    def _call(self, callbacks, result):
+        rows, exc = result
+        callback, errback = callbacks
+        if exc is None:
+            callback(rows)
+        else:
+            errback(exc)
+
+    def add_callbacks(self, callback, errback):
+        with self._lock:
+            self._callbacks = (callback, errback)
+            result = self._result
+        if result is not None:
+            self._call((callback, errback), result)
+
+    def clear_callbacks(self):
+        with self._lock:
+            self._callbacks = None
+
+    def start_fetching_next_page(self):
+        if not self.has_more_pages:
+            raise Exception("No more pages to fetch")
+        with self._lock:
+            self._result = None
+        self._request_page()
+
+
+class FakeSession(object):
+    """ Session of a FakeCluster, it counts the range queries it runs """
+    def __init__(self, cluster):
+        self.cluster = cluster
+        # Set by the estimator for wire sizes: range queries then return tuples of cell sizes
+        self.client_protocol_handler = None
+        self.queries = 0
+        self._lock = Lock()
+
+    def prepare(self, query):
+        if 'system_schema.columns' in query:
+            return FakeStatement(query, 'columns')
+        if 'system_schema.types' in query:
+            return FakeStatement(query, 'types')
+        if 'system_schema.tables' in query:
+            return FakeStatement(query, 'tables')
+        if 'system.size_estimates' in query:
+            return FakeStatement(query, 'size_estimates')
+        match = re.match(r'SELECT\s+(json\s+)?(.+?)\s+FROM\s+(%s)\.(%s)\s+WHERE(.*)' % (_NAME, _NAME), query, re.I | re.S)
+        if match is None:
+            raise InvalidRequest("Query not supported by the fake cluster: %s" % query)
+        table = self.cluster.tables.get((_unquote(match.group(3)), _unquote(match.group(4))))
+        if table is None:
+            raise InvalidRequest("unconfigured table %s" % match.group(4))
+        columns = tuple(_unquote(c) for c in re.findall(_NAME, match.group(2)))
+        keys = tuple(_unquote(c) for c in re.findall(r'(%s)\s*(?:[,)]|=\?)' % _NAME, match.group(5)))
+        for column in columns + keys:
+            if column not in table.column_types:
+                raise InvalidRequest("Undefined column name %s" % column)
+        kind = 'range' if 'token(' in query else 'partition'
+        return FakeStatement(query, kind, table, columns, bool(match.group(1)))
+
+    def execute(self, statement, parameters=None, host=None, **kwargs):
+        if statement.kind == 'columns':
+            table = self.cluster.tables.get(tuple(parameters))
+            if table is None:
+                return []
+            kinds = dict((c, ('partition_key', i)) for i, c in enumerate(table.partition_key))
+            kinds.update((c, ('clustering', i)) for i, c in enumerate(table.clustering_key))
+            return [ColumnRow(c, kinds.get(c, ('regular', -1))[0], kinds.get(c, ('regular', -1))[1], table.column_types[c])
+                    for c in table.columns]
+        if statement.kind == 'types':
+            return []
+        if statement.kind == 'tables':
+            return [TableRow(name) for keyspace, name in sorted(self.cluster.tables) if keyspace == parameters[0]]
+        if statement.kind == 'size_estimates':
+            return self.cluster.size_estimates(tuple(parameters), host)
+        raise InvalidRequest("Use execute_async for range queries")
+
+    def execute_async(self, statement, parameters=None, execution_profile=None, host=None, paging_state=None, **kwargs):
+        with self._lock:
+            self.queries += 1
+        if paging_state is not None:
+            pos, stop = paging_state
+        elif statement.kind == 'partition':
+            # Partition key values then the limit
+            pos, stop = statement.table.partition_rows(tuple(parameters[:-1]))
+            stop = min(stop, pos + parameters[-1])
+        else:
+            start, end, limit = parameters
+            tokens = statement.table.tokens
+            pos = bisect_right(tokens, start)
+            stop = min(bisect_right(tokens, end), pos + limit)
+        return FakeFuture(self, statement, pos, stop, host)
+
+    def page(self, statement, pos, end):
+        """ Rows pos to end of the statement's table, in the form the query returns them """
+        table = statement.table
+        if self.client_protocol_handler is not None:
+            if statement.json:
+                return [(text_size(j),) for j in table.json_rows()[pos:end]]
+            sizes = table.cell_sizes[pos:end]
+            if statement.columns != tuple(table.columns):
+                indexes = [table.columns.index(c) for c in statement.columns]
+                sizes = [tuple(s[i] for i in indexes) for s in sizes]
+            return sizes
+        if statement.json:
+            return [JsonRow(j) for j in table.json_rows()[pos:end]]
+        row_type = table.row_type(statement.columns)
+        if statement.columns == tuple(table.columns):
+            return [row_type._make(row) for row in table.rows[pos:end]]
+        indexes = [table.columns.index(c) for c in statement.columns]
+        return [row_type._make(row[i] for i in indexes) for row in table.rows[pos:end]]
+
+
+class FakeCluster(object):
+    """
+        Cluster of nodes hosts with vnodes tokens each, serving tables. Every page takes
+        latency + latency_per_row * rows seconds, plus up to jitter times that at random,
+        and fails with ReadTimeout with probability error_rate.
+    """
+    def __init__(self, tables, nodes=3, vnodes=16, datacenter='datacenter1', replication_factor=None,
+                 latency=0.0, latency_per_row=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.tables = dict(((t.keyspace, t.name), t) for t in tables)
+        self.latency = latency
+        self.latency_per_row = latency_per_row
+        self.jitter = jitter
+        self.error_rate = error_rate
+        rnd = random.Random(seed)
+        self.hosts = [FakeHost('10.0.0.%d' % (i + 1), datacenter) for i in range(nodes)]
+        tokens = sorted(rnd.randrange(MIN_TOKEN + 1, MAX_TOKEN) for _ in range(nodes * vnodes))
+        owners = [self.hosts[i % nodes] for i in range(len(tokens))]
+        self.metadata = FakeMetadata(FakeTokenMap(tokens, owners, replication_factor or min(3, nodes)), self.hosts)
+        self.is_shutdown = False
+        self._rnd = random.Random(seed)
+        self._rnd_lock = Lock()
+        self._loop = None
+        self._loop_lock = Lock()
+        # Pages requested and not yet delivered, in total and per host (None: the driver picks)
+        self.pages_in_flight = 0
+        self.peak_pages_in_flight = 0
+        self.host_pages_in_flight = {}
+        self.peak_host_pages_in_flight = {}
+        self._pages_lock = Lock()
+
+    def page_sent(self, host):
+        with self._pages_lock:
+            self.pages_in_flight += 1
+            self.peak_pages_in_flight = max(self.peak_pages_in_flight, self.pages_in_flight)
+            n = self.host_pages_in_flight[host] = self.host_pages_in_flight.get(host, 0) + 1
+            self.peak_host_pages_in_flight[host] = max(self.peak_host_pages_in_flight.get(host, 0), n)
+
+    def page_done(self, host):
+        with self._pages_lock:
+            self.pages_in_flight -= 1
+            self.host_pages_in_flight[host] -= 1
+
+    @property
+    def loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = _EventLoop()
+            return self._loop
+
+    def connect(self, keyspace=None):
+        self.is_shutdown = False
+        return FakeSession(self)
+
+    def refresh_keyspace_metadata(self, keyspace):
+        pass
+
+    def shutdown(self):
+        self.is_shutdown = True
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.stop()
+            self._loop = None
+
+    def page_latency(self, rows):
+        latency = self.latency + self.latency_per_row * rows
+        if self.jitter and latency:
+            with self._rnd_lock:
+                latency += latency * self.jitter * self._rnd.random()
+        return latency
+
+    def page_fails(self):
+        if not self.error_rate:
+            return False
+        with self._rnd_lock:
+            return self._rnd.random() < self.error_rate
+
+    def size_estimates(self, key, host=None):
+        """ Rows of system.size_estimates for the primary ranges of host, or of every host """
+        table = self.tables.get(key)
+        if table is None:
+            return []
+        token_map = self.metadata.token_map
+        values = token_map._values
+        rows = []
+        for i, end in enumerate(values):
+            if host is not None and token_map._owners[i] is not host:
+                continue
+            start = values[i - 1]
+            if i == 0:
+                # The range that wraps around the ring
+                high, low = table.partition_estimates(start, MAX_TOKEN), table.partition_estimates(MIN_TOKEN, end)
+                partitions = high[0] + low[0]
+                mean = (high[0] * high[1] + low[0] * low[1]) // partitions if partitions else 0
+            else:
+                partitions, mean = table.partition_estimates(start, end)
+            rows.append(EstimateRow(str(start), str(end), partitions, mean))
+        return rows
+
+
+def attach(estimator, cluster):
+    """ Makes estimator use cluster instead of connecting to Cassandra, returns estimator """
+    estimator._cluster = cluster
+    estimator._session = cluster.connect()
+    return estimator
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from fake_cluster import FakeCluster, attach
+from benchmark import benchmark_table
+from row_estimator_for_apache_cassandra.async_estimator import AsyncEstimator
+
+class FakeFuture(object):
+    """ Delivers pages of 10 rows of (id, 'hello') from the caller's thread """
+    def __init__(self, rows):
+        self.pages = [rows[i:i + 10] for i in range(0, len(rows), 10)] or [[]]
+        self.callback = None
+        self._paging_state = None
+
+    @property
+    def has_more_pages(self):
+        return bool(self.pages)
+
+    def add_callbacks(self, callback, errback):
+        self.callback = callback
+        self.start_fetching_next_page()
+
+    def start_fetching_next_page(self):
+        self.callback(self.pages.pop(0))
+
+    def clear_callbacks(self):
+        self.callback = lambda rows: None
+
+class FakeSession(object):
+    def __init__(self):
+        self.queries = 0
+
+    def prepare(self, query):
+        return SimpleNamespace(query=query)
+
+    def execute(self, statement, params=None):
+        if 'system_schema.columns' in statement.query:
+            return [SimpleNamespace(column_name='id', position=0, kind='partition_key', type='int'),
+                    SimpleNamespace(column_name='v', position=-1, kind='regular', type='text')]
+        return []
+
+    def execute_async(self, statement, params, **kwargs):
+        self.queries += 1
+        return FakeFuture([(i, 'hello') for i in range(params[2])])
+
+def async_estimator(**settings):
+    estimator = AsyncEstimator('127.0.0.1', 9042, keyspace='ks', sampling='stratified', strata=8, seed=1,
+                               rows_per_request=25, **settings)
+    estimator.estimator._session = FakeSession()
+    return estimator
+
+def test_async_estimate_many_tables():
+    estimator = async_estimator(concurrency=3, max_in_flight=4)
+    summaries = asyncio.run(estimator.estimate_many([('ks', 't1'), ('ks', 't2')]))
+    assert [s['table'] for s in summaries] == ['t1', 't2']
+    assert all(s['rows'] == 8 * 25 and s['ranges_completed'] == 8 and s['mean'] == 9 for s in summaries)
+
+def test_async_pages_stream_as_size_batches():
+    estimator = async_estimator()
+
+    async def first_range():
+        batches = []
+        async for batch in estimator.iter_pages('ks', 't'):
+            batches.append(batch)
+            if batch.range_done:
+                break
+        return batches
+
+    batches = asyncio.run(first_range())
+    assert [len(b.sizes) for b in batches] == [10, 10, 5]
+    assert all(size == 9 for b in batches for size in b.sizes)
+    assert [b.range_done for b in batches] == [False, False, True]
+
+def cluster_estimator(cluster, **settings):
+    estimator = AsyncEstimator('127.0.0.1', 9042, token_step=1, rows_per_request=100, pagination=30, concurrency=3,
+                               **settings)
+    attach(estimator.estimator, cluster)
+    return estimator
+
+def test_async_rejects_row_sampler_settings():
+    for settings in ({'max_p99_ms': 20}, {'routing': 'replica'}, {'checkpoint_file': 'run.db'}, {'per_column': True},
+                     {'aggregate_partitions': True}):
+        with pytest.raises(ValueError):
+            AsyncEstimator('127.0.0.1', 9042, **settings)
+
+def test_async_retries_timed_out_pages():
+    flaky = cluster_estimator(FakeCluster([benchmark_table(300)], error_rate=0.1, seed=3), max_retries=20)
+    clean = cluster_estimator(FakeCluster([benchmark_table(300)], seed=3))
+    flaky_summary, clean_summary = asyncio.run(flaky.estimate('bench', 'events')), asyncio.run(clean.estimate('bench', 'events'))
+    assert flaky_summary['failed_ranges'] == 0 and flaky_summary['ranges_completed'] == flaky_summary['ranges_total']
+    assert flaky_summary['rows'] == clean_summary['rows']
+    assert flaky_summary['mean'] == pytest.approx(clean_summary['mean'])
+    assert flaky.estimator._session.queries > clean.estimator._session.queries
+
+def test_async_keeps_to_max_rows_per_sec():
+    cluster = FakeCluster([benchmark_table(300)])
+    started = time.monotonic()
+    summary = asyncio.run(cluster_estimator(cluster, max_rows_per_sec=1000).estimate('bench', 'events'))
+    # The bucket starts with one second of rows, the rest is paid at the rate
+    assert time.monotonic() - started >= (summary['rows'] - 1000 - 100) / 1000.0 > 0
+    cluster.shutdown()
+
+def test_async_execution_timeout_keeps_partial_results():
+    cluster = FakeCluster([benchmark_table(300)], latency=0.05)
+    estimator = cluster_estimator(cluster, execution_timeout=0.3)
+    started = time.monotonic()
+    summary = asyncio.run(estimator.estimate('bench', 'events'))
+    assert time.monotonic() - started < 0.6
+    assert summary['stop_reason'] == 'timeout'
+    assert 0 < summary['ranges_completed'] < summary['ranges_total'] and summary['rows'] > 0
+    cluster.shutdown()
+
+def test_async_cancelled_task_abandons_its_queries():
+    cluster = FakeCluster([benchmark_table(300)], latency=0.05)
+    estimator = cluster_estimator(cluster, max_in_flight=2)
+
+    async def cancel_midway():
+        task = asyncio.ensure_future(estimator.estimate('bench', 'events'))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        queries = estimator.estimator._session.queries
+        await asyncio.sleep(0.2)
+        # No query was sent after the cancel and the slots of the task were given back
+        assert estimator.estimator._session.queries == queries
+        assert estimator._slots._value == 2
+
+    asyncio.run(cancel_midway())
+    cluster.shutdown()
@@ -0,0 +1,54 @@
+from fake_cluster import FakeCluster, attach, wire_sizer
+from benchmark import MODES, benchmark_table, compare, parse_args, run
+from row_estimator_for_apache_cassandra.estimator import Estimator
+from row_estimator_for_apache_cassandra.sizes import build_sizer
+
+def sample(cluster, **settings):
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1,
+                                 rows_per_request=100, pagination=30, concurrency=3, **settings), cluster)
+    estimator.row_sampler()
+    return estimator
+
+def test_benchmark_wire_sizes_add_collection_prefixes():
+    table = benchmark_table(300)
+    cluster = FakeCluster([table], latency=0.001)
+    decoded, wire = sample(cluster), sample(cluster, wire_sizes=True, per_column=True)
+    assert decoded.row_stats.count == wire.row_stats.count > 0
+    assert wire.row_stats.total > decoded.row_stats.total
+    # Read every row, to compare each column with the decoded sizes of the whole table
+    whole = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1,
+                             rows_per_request=len(table.rows), wire_sizes=True, per_column=True), cluster)
+    whole.row_sampler()
+    assert whole.row_stats.count == len(table.rows)
+    for i, column in enumerate(table.columns):
+        size = build_sizer(table.column_types[column])
+        decoded_total = sum(size(row[i]) for row in table.rows)
+        if column in ('tags', 'attrs'):
+            # Element count and element length prefixes of set<text> and map<text, int>
+            assert whole.column_totals[i] > decoded_total
+        else:
+            assert whole.column_totals[i] == decoded_total
+    cluster.shutdown()
+
+def test_benchmark_wire_sizer_matches_the_driver():
+    assert wire_sizer('set<text>')({'ab', 'cde'}) == 17
+    assert wire_sizer('map<text, int>')({'ab': 1, 'c': 2}) == 31
+    assert wire_sizer('set<text>')(set()) == 0
+    assert wire_sizer('int')(7) == 4
+
+def test_benchmark_retries_timed_out_pages():
+    cluster = FakeCluster([benchmark_table(300)], error_rate=0.1, seed=3)
+    flaky = sample(cluster, max_retries=20)
+    assert not flaky.failed_ranges
+    assert flaky.row_stats.total == sample(FakeCluster([benchmark_table(300)], seed=3)).row_stats.total
+    cluster.shutdown()
+
+def test_benchmark_runs_every_mode():
+    results = run(parse_args(['--partitions', '200', '--repeat', '1', '--helper-items', '500', '--rows-per-request', '50']))
+    assert set(results['modes']) == set(MODES)
+    assert all(r['rows'] > 0 and r['rows_per_sec'] > 0 and r['peak_mib'] > 0 for r in results['modes'].values())
+    assert all(r['us_per_item'] > 0 for r in results['helpers'].values())
+    slower = {'modes': dict((m, dict(r, rows_per_sec=r['rows_per_sec'] * 2)) for m, r in results['modes'].items()),
+              'helpers': {}}
+    assert len(compare(results, slower, 0.25)) == len(MODES)
+    assert compare(results, results, 0.25) == []
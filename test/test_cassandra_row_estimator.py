@@ -1,60 +1,60 @@
 import pytest
 
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
-from cassandra import ConsistencyLevel
-from cassandra.cluster import ExecutionProfile
-from cassandra.policies import WhiteListRoundRobinPolicy
-
-from cassandra_row_estimator.estimator import Estimator
-
-def add_helper(n):
-        return columns_in_bytes+n
-
-@pytest.fixture
-def test_cassandra_row_estimator_init():
-    endpoint_name='127.0.0.1'
-    port=9042
-    auth_provider = None
-    ssl_context=None
-    auth_provider = PlainTextAuthProvider('cassandra', 'cassandra')
-    node1_profile = ExecutionProfile(load_balancing_policy=WhiteListRoundRobinPolicy([endpoint_name]))
-    profiles = {'node1': node1_profile}
-    cluster = Cluster([endpoint_name], port=port ,auth_provider=auth_provider, ssl_context=ssl_context, control_connection_timeout=360, execution_profiles=profiles)
-    session = cluster.connect()
-    session.execute("CREATE KEYSPACE IF NOT EXISTS cassandra_row_estimator WITH replication = {'class': 'SimpleStrategy', 'replication_factor': 1 }")
-    session.execute("CREATE TABLE IF NOT EXISTS cassandra_row_estimator.test (a int PRIMARY KEY, b text)")
-    params = [1, 'This is a simple test']
-    session.execute("INSERT INTO cassandra_row_estimator.test (a, b) VALUES (%s, %s)", params)
-
-
-estimator = Estimator('127.0.0.1', 9042, 'cassandra', 'cassandra', None, 'datacenter1', 'cassandra_row_estimator', 'test',3600, 2, 1000, 3000, None)
-estimator.row_sampler(json=False)
-columns_in_bytes = estimator.get_total_column_size()
-rows_in_bytes = estimator.rows_in_bytes
-rows_columns_in_bytes = map(add_helper, rows_in_bytes)
-val = list(rows_columns_in_bytes)
-
-def test_cassandra_row_estimator_row_in_bytes():
-    assert rows_in_bytes[0] == 22
-
-def test_cassandra_row_estimator_columns_in_bytes():
+from fake_cluster import FakeCluster, FakeTable, attach
+from row_estimator_for_apache_cassandra.estimator import Estimator
+
+@pytest.fixture(scope='module')
+def sampled():
+    # CREATE TABLE cassandra_row_estimator.test (a int PRIMARY KEY, b text) holding one row
+    table = FakeTable('cassandra_row_estimator', 'test', [('a', 'int'), ('b', 'text')], partition_key=['a'],
+                      rows=[(1, 'This is a simple test')])
+    estimator = Estimator('127.0.0.1', 9042, 'cassandra', 'cassandra', None, 'datacenter1', 'cassandra_row_estimator', 'test',3600, 2, 1000, 3000, None)
+    # A single token, so token_step 2 still reads the whole ring
+    attach(estimator, FakeCluster([table], nodes=1, vnodes=1))
+    estimator.row_sampler(json=False)
+    yield estimator.row_stats, estimator.get_total_column_size()
+    estimator.close()
+
+def test_cassandra_row_estimator_row_in_bytes(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.min == 25
+
+def test_cassandra_row_estimator_columns_in_bytes(sampled):
+    row_stats, columns_in_bytes = sampled
     assert columns_in_bytes == 2
 
-def test_cassandra_row_estimator_mean():
-    assert estimator.mean(val) == 24   
-
-def test_cassandra_row_estimator_weighted_mean():
-    assert estimator.weighted_mean(val) == 24
-
-def test_cassandra_row_estimator_median():
-    assert estimator.median(val) == 24
-
-def test_cassandra_row_estimator_qtl_p10():
-    assert estimator.quartiles(val, 0.1) == 24
-
-def test_cassandra_row_estimator_qtl_p50():
-    assert estimator.quartiles(val, 0.5) == 24
-
-def test_cassandra_row_estimator_qtl_p90():
-    assert estimator.quartiles(val, 0.9) == 24
+def test_cassandra_row_estimator_mean(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.mean + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_weighted_mean(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.weighted_mean + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_median(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.quantile(0.5) + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_qtl_p10(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.quantile(0.1) + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_qtl_p50(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.quantile(0.5) + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_qtl_p90(sampled):
+    row_stats, columns_in_bytes = sampled
+    assert row_stats.quantile(0.9) + columns_in_bytes == 27
+
+def test_cassandra_row_estimator_quotes_identifiers():
+    # Case-sensitive and reserved word names, as in CREATE TABLE "Ks"."Events" ("userId" int, "select" text, ...)
+    table = FakeTable('Ks', 'Events', [('userId', 'int'), ('select', 'text')], partition_key=['userId'],
+                      rows=[(i, 'x' * i) for i in range(20)])
+    cluster = FakeCluster([table], nodes=1, vnodes=1)
+    for settings, json in (({}, False), ({}, True), ({'aggregate_partitions': True}, False)):
+        estimator = attach(Estimator('127.0.0.1', 9042, keyspace='Ks', table='Events', token_step=1,
+                                     rows_per_request=100, **settings), cluster)
+        estimator.row_sampler(json=json)
+        assert estimator.row_stats.count == 20
+    cluster.shutdown()
@@ -0,0 +1,65 @@
+import pytest
+
+from fake_cluster import FakeCluster, attach
+from benchmark import benchmark_table
+from row_estimator_for_apache_cassandra.estimator import Estimator
+from row_estimator_for_apache_cassandra.checkpoint import Checkpoint
+from row_estimator_for_apache_cassandra.stats import StreamingStats
+
+PLAN = {'keyspace': 'ks', 'table': 'tbl', 'sampling': 'ring'}
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'run.db')
+    stats = StreamingStats()
+    for v in range(100):
+        stats.add(v)
+    checkpoint = Checkpoint(path, PLAN)
+    assert checkpoint.load_state() is None
+    checkpoint.save([(-10, 0), (0, 10)], {'row_stats': stats.to_dict()})
+    checkpoint.close()
+
+    resumed = Checkpoint(path, PLAN)
+    assert resumed.completed_ranges() == {(-10, 0), (0, 10)}
+    assert StreamingStats.from_dict(resumed.load_state()['row_stats']).total == stats.total
+
+def test_checkpoint_keeps_the_first_seed(tmp_path):
+    path = str(tmp_path / 'run.db')
+    assert Checkpoint(path, PLAN).seed(42) == 42
+    assert Checkpoint(path, PLAN).seed(7) == 42
+
+def test_checkpoint_rejects_other_plan(tmp_path):
+    path = str(tmp_path / 'run.db')
+    Checkpoint(path, PLAN).close()
+    with pytest.raises(ValueError):
+        Checkpoint(path, dict(PLAN, table='other'))
+
+def sample(cluster, path, **settings):
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1, rows_per_request=100,
+                                 pagination=30, concurrency=2, checkpoint_file=path, **settings), cluster)
+    estimator.row_sampler()
+    return estimator
+
+def test_checkpoint_resumed_run_reads_every_range_once(tmp_path):
+    cluster = FakeCluster([benchmark_table(300)], latency=0.03)
+    single = sample(cluster, str(tmp_path / 'single.db'))
+    path = str(tmp_path / 'run.db')
+    first = sample(cluster, path, execution_timeout=0.2)
+    assert first.stop_reason == 'timeout' and 0 < first.ranges_completed < first.ranges_total
+    resumed = sample(cluster, path)
+    assert resumed.stop_reason is None
+    assert resumed.metrics.ranges_planned == resumed.ranges_total - first.ranges_completed
+    assert sorted(resumed.completed_ranges) == sorted(single.completed_ranges)
+    assert (resumed.row_stats.count, resumed.row_stats.total) == (single.row_stats.count, single.row_stats.total)
+    cluster.shutdown()
+
+def test_checkpoint_rejects_weighted_sampling(tmp_path):
+    estimator = Estimator('127.0.0.1', 9042, sampling='weighted', checkpoint_file=str(tmp_path / 'run.db'))
+    with pytest.raises(ValueError):
+        estimator.get_sample_ranges()
+
+def test_checkpoint_keeps_the_shard_seed(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'run.db'), PLAN)
+    estimator = Estimator('127.0.0.1', 9042, sampling='stratified', strata=8, shard=(1, 2))
+    assert estimator.get_sample_ranges(checkpoint) == Estimator('127.0.0.1', 9042, sampling='stratified', strata=8,
+                                                                 seed=0, shard=(1, 2)).get_sample_ranges()
+    assert checkpoint.seed(42) == 0
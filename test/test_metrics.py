@@ -0,0 +1,59 @@
+import io
+import json
+import threading
+
+from fake_cluster import FakeCluster, attach
+from benchmark import benchmark_table
+from row_estimator_for_apache_cassandra.estimator import Estimator
+from row_estimator_for_apache_cassandra.metrics import LatencyHistogram, ThreadProfiler, to_prometheus, write_metrics
+
+def test_metrics_histogram_buckets_and_quantiles():
+    histogram = LatencyHistogram(buckets=(0.01, 0.1, 1.0))
+    for seconds in [0.005] * 90 + [0.05] * 9 + [2.0]:
+        histogram.observe(seconds)
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.99) == 0.1
+    assert histogram.quantile(1.0) == 2.0
+    assert LatencyHistogram(buckets=(0.01, 0.1)).quantile(0.5) is None
+    assert histogram.to_dict()['buckets'] == [[0.01, 90], [0.1, 99], [1.0, 99], ['+Inf', 100]]
+
+def test_metrics_count_pages_retries_and_ranges():
+    cluster = FakeCluster([benchmark_table(300)], error_rate=0.1, seed=3)
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1,
+                                 rows_per_request=100, pagination=30, concurrency=3, max_retries=20), cluster)
+    estimator.row_sampler()
+    m = estimator.metrics.to_dict()
+    assert m['rows'] == estimator.row_stats.count and m['bytes'] == estimator.row_stats.total
+    assert m['ranges_completed'] == m['ranges_planned'] == estimator.ranges_total
+    assert m['ranges_in_flight'] == 0 and m['ranges_failed'] == 0
+    assert m['retries'] == m['timeouts'] > 0
+    assert m['page_latency_seconds']['count'] == m['pages'] >= m['ranges_completed']
+    assert len(m['slowest_ranges']) == 5
+    cluster.shutdown()
+
+def test_metrics_prometheus_and_json_files(tmp_path):
+    cluster = FakeCluster([benchmark_table(100)])
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=4,
+                                 rows_per_request=50, pagination=20), cluster)
+    estimator.row_sampler()
+    text = to_prometheus(estimator.metrics)
+    assert 'row_estimator_rows_total %r' % float(estimator.row_stats.count) in text.splitlines()
+    assert 'row_estimator_page_latency_seconds_bucket{le="+Inf"} %r' % float(estimator.metrics.pages) in text
+    assert '# TYPE row_estimator_page_latency_seconds histogram' in text
+    path = str(tmp_path / 'metrics.json')
+    write_metrics(path, estimator.metrics)
+    with open(path) as f:
+        assert json.load(f)['pages'] == estimator.metrics.pages
+    cluster.shutdown()
+
+def busy_work():
+    return sum(range(1000))
+
+def test_metrics_profiler_sees_new_threads():
+    profiler = ThreadProfiler()
+    profiler.start()
+    thread = threading.Thread(target=busy_work)
+    thread.start()
+    thread.join()
+    stats = profiler.stop(stream=io.StringIO())
+    assert any(name == 'busy_work' for _, _, name in stats.stats)
@@ -0,0 +1,85 @@
+import json
+
+from row_estimator_for_apache_cassandra.offline import estimate_files, parse_column_types, text_sizer
+from row_estimator_for_apache_cassandra.stats import StreamingStats
+
+COLUMN_TYPES = 'id:int,name:text,tags:set<text>,note:text'
+
+def write_csv(path, rows, header=True):
+    with open(path, 'w') as f:
+        if header:
+            f.write('id,name,tags,note\n')
+        for i in range(rows):
+            note = '"two\nlines, ""quoted"""' if i == 7 else 'x' * (i % 10)
+            f.write('%d,%s,"{\'a\', \'bb\'}",%s\n' % (i, 'n' * (i % 5 + 1), note))
+
+def test_offline_parse_column_types():
+    assert parse_column_types('id:int, tags:map<text, frozen<list<int>>>') == [('id', 'int'), ('tags', 'map<text, frozen<list<int>>>')]
+
+def test_offline_text_sizer_matches_cql_sizes():
+    assert text_sizer('int')('123') == 4
+    assert text_sizer('int')('') == 0
+    assert text_sizer('text')('é') == 2
+    assert text_sizer('blob')('0x0102ff') == 3
+    assert text_sizer('varint')('255') == 2
+    assert text_sizer('set<text>')("{'a', 'it''s'}") == 5
+    assert text_sizer('map<text, int>')("{'ab': 1, 'c': 2}") == 11
+    assert text_sizer('frozen<list<frozen<set<int>>>>')('[{1, 2}]') == 8
+
+def test_offline_csv_rows_are_measured_like_cluster_rows(tmp_path):
+    path = str(tmp_path / 'tbl.csv')
+    write_csv(path, 100)
+    result = estimate_files([path], 'csv', parse_column_types(COLUMN_TYPES), header=True, workers=1)
+    stats = StreamingStats.from_dict(result['row_stats'])
+    assert stats.count == 100
+    assert result['columns'] == ['id', 'name', 'tags', 'note']
+    assert result['column_totals'][0] == 400
+    assert result['column_totals'][2] == 300
+    # The quoted note of row 7 spans two lines: 'two\nlines, "quoted"'
+    assert stats.max == 4 + 3 + 3 + 19
+
+def test_offline_chunks_give_the_same_statistics(tmp_path):
+    path = str(tmp_path / 'tbl.csv')
+    write_csv(path, 2000, header=False)
+    column_types = parse_column_types(COLUMN_TYPES)
+    whole = StreamingStats.from_dict(estimate_files([path], 'csv', column_types, workers=1)['row_stats'])
+    chunked = StreamingStats.from_dict(estimate_files([path], 'csv', column_types, workers=2, chunk_size=1000)['row_stats'])
+    assert (chunked.count, chunked.total, chunked.min, chunked.max) == (whole.count, whole.total, whole.min, whole.max)
+
+def test_offline_chunk_boundaries_inside_quoted_values(tmp_path):
+    path = str(tmp_path / 'multiline.csv')
+    with open(path, 'w') as f:
+        for i in range(200):
+            note = '"first\nsecond, ""q""\nthird"' if i % 3 == 0 else 'x' * (i % 10)
+            f.write('%d,%s,"{\'a\'}",%s\n' % (i, 'n' * (i % 5 + 1), note))
+    column_types = parse_column_types(COLUMN_TYPES)
+    whole = StreamingStats.from_dict(estimate_files([path], 'csv', column_types, workers=1)['row_stats'])
+    assert whole.count == 200
+    for chunk_size in (97, 50, 31, 7):
+        chunked = StreamingStats.from_dict(estimate_files([path], 'csv', column_types, workers=1,
+                                                          chunk_size=chunk_size)['row_stats'])
+        assert (chunked.count, chunked.total, chunked.max) == (whole.count, whole.total, whole.max)
+
+def test_offline_sstabledump(tmp_path):
+    partitions = [
+        {'partition': {'key': ['1'], 'position': 0},
+         'rows': [{'type': 'static_block', 'cells': [{'name': 'owner', 'value': 'bob'}]},
+                  {'type': 'row', 'clustering': ['a'],
+                   'cells': [{'name': 'v', 'value': 'hello {"partition": 1}'},
+                             {'name': 'tags', 'deletion_info': {'marked_deleted': '2021-01-01T00:00:00Z'}},
+                             {'name': 'tags', 'path': ['x'], 'value': ''},
+                             {'name': 'tags', 'path': ['yy'], 'value': ''}]},
+                  {'type': 'row', 'clustering': ['b'], 'cells': [{'name': 'n', 'value': 42}]}]},
+        {'partition': {'key': ['2'], 'position': 90},
+         'rows': [{'type': 'row', 'clustering': ['c'],
+                   'cells': [{'name': 'v', 'value': 'hi'}, {'name': 'm', 'path': ['k1'], 'value': '7'}]}]},
+    ]
+    path = str(tmp_path / 'dump.json')
+    with open(path, 'w') as f:
+        json.dump(partitions, f, indent=2)
+    column_types = parse_column_types('id:int,ck:text,owner:text,m:map<text,int>,n:int,tags:set<text>,v:text')
+    for chunk_size in (1 << 20, 16):
+        result = estimate_files([path], 'sstabledump', column_types, workers=1, chunk_size=chunk_size)
+        stats = StreamingStats.from_dict(result['row_stats'])
+        assert (stats.count, stats.min, stats.max, stats.total) == (3, 12, 33, 58)
+        assert dict(zip(result['columns'], result['column_totals']))['tags'] == 3
@@ -0,0 +1,71 @@
+import pytest
+
+from fake_cluster import FakeCluster, FakeTable, attach
+from row_estimator_for_apache_cassandra.estimator import Estimator, _RangeScan
+from row_estimator_for_apache_cassandra.stats import PartitionStats
+
+# One partition of 5000 rows of 108 bytes among 399 partitions of 1 to 3 rows
+ROWS = [(0, i, 'x' * 100) for i in range(5000)] + [(p, i, 'y' * 10) for p in range(1, 400) for i in range(p % 3 + 1)]
+
+@pytest.fixture(scope='module')
+def cluster():
+    table = FakeTable('ks', 't', [('id', 'int'), ('ck', 'int'), ('v', 'text')], ['id'], ['ck'], rows=ROWS)
+    cluster = FakeCluster([table], latency=0.001)
+    yield cluster
+    cluster.shutdown()
+
+def sample(cluster, **settings):
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='ks', table='t', token_step=1, rows_per_request=200,
+                                 pagination=40, concurrency=3, **settings), cluster)
+    estimator.row_sampler()
+    return estimator
+
+def test_partitions_follow_a_wide_partition_to_the_end(cluster):
+    estimator = sample(cluster, aggregate_partitions=True, top_partitions=3)
+    largest = estimator.partition_stats.largest()
+    assert len(largest) == 3
+    assert largest[0] == {'key': '0', 'rows': 5000, 'bytes': 5000 * 108, 'write_units': 5000, 'truncated': False}
+    assert estimator.partition_stats.rows.max == 5000
+    assert estimator.summary()['partitions']['largest'][0]['key'] == '0'
+
+def test_partitions_leave_row_statistics_unchanged(cluster):
+    plain, grouped = sample(cluster), sample(cluster, aggregate_partitions=True)
+    assert plain.row_stats.count == grouped.row_stats.count
+    assert plain.row_stats.total == grouped.row_stats.total
+    # Only the follow-up of partition 0 reads rows that are not in the row statistics
+    assert grouped.row_stats.count < grouped.partition_stats.rows.total < grouped.row_stats.count + 5000
+
+def test_partitions_truncated_after_max_partition_rows(cluster):
+    estimator = sample(cluster, aggregate_partitions=True, max_partition_rows=1000)
+    top = estimator.partition_stats.largest()[0]
+    assert top['key'] == '0' and top['truncated'] and 1000 <= top['rows'] < 5000
+    assert estimator.partition_stats.truncated >= 1
+
+def test_partitions_need_decoded_rows(cluster):
+    with pytest.raises(ValueError):
+        sample(cluster, aggregate_partitions=True, wire_sizes=True)
+
+def test_partition_stats_merge_and_round_trip():
+    a, b = PartitionStats(top_k=2), PartitionStats(top_k=2)
+    for i in range(10):
+        (a if i % 2 else b).add((i, b'\x01'), i + 1, 100 * (i + 1), i + 1)
+    merged = PartitionStats.from_dict(a.merge(b).to_dict())
+    assert merged.count == 10 and merged.rows.total == 55
+    assert [p['key'] for p in merged.largest()] == ['9:0x01', '8:0x01']
+
+def test_partitions_follow_up_leaves_abandoned_ranges_alone(cluster, monkeypatch):
+    follow = _RangeScan.follow_wide_partition
+    seen = []
+
+    def cancel_then_follow(scan):
+        # cancel() lands between the last page of the range and the follow-up
+        scan.run.cancel('cancelled')
+        partition = scan.partition
+        sent = follow(scan)
+        seen.append((sent, scan.partition is partition, scan.wide_key))
+        return sent
+    monkeypatch.setattr(_RangeScan, 'follow_wide_partition', cancel_then_follow)
+    estimator = sample(cluster, aggregate_partitions=True)
+    assert seen and all(s == (True, True, None) for s in seen)
+    assert estimator.stop_reason == 'cancelled'
+    assert estimator.partition_stats.rows.total == estimator.row_stats.count
@@ -0,0 +1,35 @@
+import io
+import struct
+
+from row_estimator_for_apache_cassandra.metrics import SamplerMetrics
+from row_estimator_for_apache_cassandra.protocol import SizeOnlyResultMessage, SizeOnlyProtocolHandler, timed_protocol_handler
+
+def cell(value):
+    if value is None:
+        return struct.pack('>i', -1)
+    return struct.pack('>i', len(value)) + value
+
+def rows_body(rows):
+    # ROWS result without metadata: flags (no metadata), column count, row count, cells
+    body = struct.pack('>ii', 0x0004, len(rows[0])) + struct.pack('>i', len(rows))
+    for row in rows:
+        body += b''.join(cell(v) for v in row)
+    return io.BytesIO(body)
+
+def test_protocol_size_only_rows():
+    metadata = [('ks', 'tbl', 'a', None), ('ks', 'tbl', 'b', None)]
+    f = rows_body([[b'\x00\x00\x00\x01', b'This is a simple test'], [b'\x00\x00\x00\x02', None]])
+    msg = SizeOnlyResultMessage(0x0002)
+    msg.recv_results_rows(f, 4, {}, metadata, None)
+    assert msg.parsed_rows == [(4, 21), (4, 0)]
+    assert msg.column_names == ['a', 'b']
+    assert f.read() == b''
+
+def test_protocol_timed_handler_counts_decode_time():
+    metrics = SamplerMetrics()
+    handler = timed_protocol_handler(SizeOnlyProtocolHandler, metrics)
+    metadata = [('ks', 'tbl', 'a', None)]
+    body = struct.pack('>i', 0x0002) + rows_body([[b'\x00\x00\x00\x01']]).read()
+    msg = handler.decode_message(4, {}, 0, 0, SizeOnlyResultMessage.opcode, body, None, metadata)
+    assert msg.parsed_rows == [(4,)]
+    assert metrics.decode_seconds > 0
@@ -0,0 +1,66 @@
+import pytest
+
+from row_estimator_for_apache_cassandra.results import merge_results, write_result, read_result, RESULT_VERSION
+from row_estimator_for_apache_cassandra.stats import StreamingStats, PartitionStats
+
+def shard_result(k, n, token_ranges, sizes):
+    stats = StreamingStats()
+    for v in sizes:
+        stats.add(v)
+    return {'version': RESULT_VERSION, 'keyspace': 'ks', 'table': 'tbl', 'json': False, 'shards': [[k, n]],
+            'ranges_total': len(token_ranges), 'ranges_completed': len(token_ranges),
+            'completed_ranges': [list(r) for r in token_ranges], 'failed_ranges': [],
+            'columns': ['id', 'v'], 'column_names_bytes': 3, 'column_totals': [4 * len(sizes), sum(sizes) - 4 * len(sizes)],
+            'row_stats': stats.to_dict()}
+
+def test_merged_shards_match_a_single_run():
+    token_ranges = [(i, i + 1) for i in range(12)]
+    sizes = {r: [r[0] * 10 + j for j in range(5)] for r in token_ranges}
+    single = StreamingStats()
+    for r in token_ranges:
+        for v in sizes[r]:
+            single.add(v)
+    results = []
+    for k in (1, 2, 3):
+        mine = token_ranges[k - 1::3]
+        results.append(shard_result(k, 3, mine, [v for r in mine for v in sizes[r]]))
+
+    merged = merge_results(results)
+    stats = StreamingStats.from_dict(merged['row_stats'])
+    assert stats.count == single.count
+    assert stats.total == single.total
+    assert stats.min == single.min and stats.max == single.max
+    assert stats.mean == pytest.approx(single.mean)
+    assert stats.variance == pytest.approx(single.variance)
+    assert stats.quantile(0.5) == single.quantile(0.5)
+    assert merged['ranges_total'] == 12 and merged['ranges_completed'] == 12
+    assert merged['column_totals'] == [4 * single.count, single.total - 4 * single.count]
+
+def test_merge_rejects_overlapping_shards():
+    result = shard_result(1, 2, [(0, 1)], [10])
+    with pytest.raises(ValueError):
+        merge_results([result, result])
+
+def test_merge_rejects_other_tables():
+    other = dict(shard_result(2, 2, [(1, 2)], [10]), table='other')
+    with pytest.raises(ValueError):
+        merge_results([shard_result(1, 2, [(0, 1)], [10]), other])
+
+def test_result_file_round_trip(tmp_path):
+    path = str(tmp_path / 'shard1.json')
+    result = shard_result(1, 2, [(0, 1)], [10, 20])
+    write_result(path, result)
+    assert read_result(path) == result
+
+def test_merge_partition_stats():
+    results = []
+    for k, r in ((1, (0, 1)), (2, (1, 2))):
+        partitions = PartitionStats(top_k=2)
+        for i in range(3):
+            partitions.add((k * 10 + i,), i + 1, 100 * k + i, 1)
+        results.append(dict(shard_result(k, 2, [r], [10]), partition_stats=partitions.to_dict()))
+    merged = PartitionStats.from_dict(merge_results(results)['partition_stats'])
+    assert merged.count == 6 and merged.rows.total == 12
+    assert [p['key'] for p in merged.largest()] == ['22', '21']
+    with pytest.raises(ValueError):
+        merge_results([results[0], shard_result(2, 2, [(1, 2)], [10])])
@@ -0,0 +1,80 @@
+import os
+import time
+
+from fake_cluster import FakeCluster, FakeTable, attach
+from benchmark import benchmark_table
+from row_estimator_for_apache_cassandra.estimator import Estimator
+
+def test_sampler_timeout_keeps_partial_results():
+    cluster = FakeCluster([benchmark_table(300)], latency=0.05)
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1,
+                                 rows_per_request=100, pagination=30, concurrency=2, execution_timeout=0.3), cluster)
+    started = time.monotonic()
+    estimator.row_sampler()
+    assert time.monotonic() - started < 0.6
+    assert estimator.stop_reason == 'timeout' and estimator.timed_out
+    assert 0 < estimator.ranges_completed < estimator.ranges_total
+    assert estimator.row_stats.count > 0
+    # Pages of abandoned ranges arrive later, their callbacks were cleared
+    rows, pages, queries = estimator.row_stats.count, estimator.metrics.pages, estimator._session.queries
+    time.sleep(0.3)
+    assert (estimator.row_stats.count, estimator.metrics.pages, estimator._session.queries) == (rows, pages, queries)
+    m = estimator.metrics.to_dict()
+    assert m['ranges_in_flight'] == 0 and m['ranges_failed'] == 0
+    # Abandoned ranges are counted apart and stay out of the latency of read ranges
+    assert m['ranges_completed'] == m['range_latency_seconds']['count'] == estimator.ranges_completed
+    assert m['ranges_abandoned'] == estimator.metrics.ranges_started - estimator.ranges_completed > 0
+    cluster.shutdown()
+
+def small_tables(n, partitions=200):
+    return [FakeTable('ks', 't%d' % i, [('id', 'int'), ('v', 'text')], ['id'], partitions=partitions, seed=i)
+            for i in range(n)]
+
+def test_sampler_estimate_tables_share_the_window(tmp_path):
+    cluster = FakeCluster(small_tables(4), latency=0.005)
+    checkpoint = str(tmp_path / 'job')
+    estimator = attach(Estimator('127.0.0.1', 9042, token_step=1, rows_per_request=50, pagination=20, concurrency=3,
+                                 checkpoint_file=checkpoint), cluster)
+    tables = estimator.get_tables(['ks'])
+    assert tables == [('ks', 't0'), ('ks', 't1'), ('ks', 't2'), ('ks', 't3')]
+    summaries = list(estimator.estimate_tables(tables, table_workers=3))
+    assert sorted(s['table'] for s in summaries) == ['t0', 't1', 't2', 't3']
+    assert all(s['rows'] > 0 and s['ranges_completed'] == s['ranges_total'] and s['stop_reason'] is None
+               for s in summaries)
+    # Three tables sampled at once, but never more ranges in flight than the job's concurrency
+    assert 1 < cluster.peak_pages_in_flight <= 3
+    assert all(os.path.exists('%s.ks.t%d' % (checkpoint, i)) for i in range(4))
+    cluster.shutdown()
+
+def test_sampler_estimate_tables_times_out_unstarted_tables():
+    cluster = FakeCluster(small_tables(6), latency=0.05)
+    estimator = attach(Estimator('127.0.0.1', 9042, token_step=1, rows_per_request=50, pagination=20, concurrency=2,
+                                 execution_timeout=0.3), cluster)
+    summaries = list(estimator.estimate_tables(estimator.get_tables(['ks']), table_workers=2))
+    assert len(summaries) == 6
+    assert all(s['stop_reason'] == 'timeout' for s in summaries)
+    assert any(s['ranges_total'] == 0 for s in summaries)
+    cluster.shutdown()
+
+def test_sampler_replica_routing_respects_the_per_host_limit():
+    cluster = FakeCluster([benchmark_table(300)], nodes=4, vnodes=8, replication_factor=2, latency=0.005)
+    estimator = attach(Estimator('127.0.0.1', 9042, keyspace='bench', table='events', token_step=1, rows_per_request=100,
+                                 pagination=30, concurrency=8, routing='replica', max_in_flight_per_host=1), cluster)
+    session = estimator._session
+    sent = []
+    execute_async = session.execute_async
+
+    def record(statement, parameters=None, host=None, **kwargs):
+        if kwargs.get('paging_state') is None:
+            sent.append((parameters[1], host))
+        return execute_async(statement, parameters, host=host, **kwargs)
+    session.execute_async = record
+    estimator.row_sampler()
+    token_map = cluster.metadata.token_map
+    assert len(sent) == estimator.ranges_total == estimator.ranges_completed
+    # Each range (start, end] goes to a replica of its end token
+    assert all(host in token_map.get_replicas('bench', token_map.token_class(end)) for end, host in sent)
+    assert len(set(host for _, host in sent)) == 4
+    assert all(peak == 1 for peak in cluster.peak_host_pages_in_flight.values())
+    assert cluster.peak_pages_in_flight > 1
+    cluster.shutdown()
@@ -0,0 +1,32 @@
+import collections
+from decimal import Decimal
+
+from row_estimator_for_apache_cassandra.sizes import build_sizer, parse_type, text_size
+
+Address = collections.namedtuple('Address', ['street', 'zip'])
+
+def test_sizes_parse_nested_type():
+    assert parse_type('frozen<map<text, list<int>>>') == ('frozen', [('map', [('text', []), ('list', [('int', [])])])])
+
+def test_sizes_fixed_width():
+    assert build_sizer('int')(1) == 4
+    assert build_sizer('bigint')(1) == 8
+    assert build_sizer('timestamp')(0) == 8
+    assert build_sizer('uuid')(None) == 0
+
+def test_sizes_text_is_utf8_length():
+    assert build_sizer('text')('This is a simple test') == 21
+    assert text_size('é') == 2
+
+def test_sizes_variable_numbers():
+    assert build_sizer('varint')(255) == 2
+    assert build_sizer('decimal')(Decimal('1.25')) == 5
+
+def test_sizes_collections():
+    assert build_sizer('list<int>')([1, 2, 3]) == 12
+    assert build_sizer('map<text, frozen<set<bigint>>>')({'ab': {1, 2}}) == 18
+    assert build_sizer('tuple<int, text>')((1, None)) == 4
+
+def test_sizes_udt():
+    sizer = build_sizer('frozen<address>', {'address': [('street', 'text'), ('zip', 'int')]})
+    assert sizer(Address('Main', 98101)) == 8
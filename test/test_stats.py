@@ -0,0 +1,67 @@
+import random
+
+from row_estimator_for_apache_cassandra.estimator import Estimator
+from row_estimator_for_apache_cassandra.stats import KLLSketch, StreamingStats, ConvergenceMonitor
+
+estimator = Estimator('127.0.0.1', 9042)
+
+def stats_of(values):
+    stats = StreamingStats()
+    for v in values:
+        stats.add(v)
+    return stats
+
+def test_stats_match_list_methods():
+    values = [random.Random(1).randint(10, 500) for _ in range(999)]
+    stats = stats_of(values)
+    assert stats.count == len(values)
+    assert stats.min == min(values) and stats.max == max(values)
+    assert abs(stats.mean - estimator.mean(values)) < 1e-9
+    assert abs(stats.weighted_mean - estimator.weighted_mean(values)) < 1e-9
+
+def test_stats_exact_quantiles_for_small_samples():
+    values = list(range(100))
+    stats = stats_of(values)
+    for q in (0.1, 0.5, 0.9):
+        assert stats.quantile(q) == estimator.quartiles(list(values), q)
+
+def test_stats_merge_equals_single_stream():
+    rnd = random.Random(2)
+    values = [rnd.gauss(1000, 100) for _ in range(5000)]
+    merged = stats_of(values[:1234]).merge(stats_of(values[1234:]))
+    single = stats_of(values)
+    assert merged.count == single.count
+    assert abs(merged.mean - single.mean) < 1e-6
+    assert abs(merged.variance - single.variance) < 1e-3
+    assert abs(merged.weighted_mean - single.weighted_mean) < 1e-6
+
+def test_stats_sketch_memory_is_bounded():
+    sketch = KLLSketch(k=200, seed=3)
+    rnd = random.Random(3)
+    for _ in range(200000):
+        sketch.update(rnd.random())
+    assert sum(len(c) for c in sketch.compactors) < 1000
+    assert abs(sketch.quantile(0.5) - 0.5) < 0.02
+    assert abs(sketch.quantile(0.99) - 0.99) < 0.02
+
+def test_stats_round_trip():
+    stats = stats_of(range(10000))
+    restored = StreamingStats.from_dict(stats.to_dict())
+    assert restored.count == stats.count and restored.quantile(0.5) == stats.quantile(0.5)
+
+def test_stats_convergence_needs_more_ranges_for_skewed_data():
+    def ranges_until_converged(spread):
+        rnd = random.Random(4)
+        monitor = ConvergenceMonitor(0.02, 0.95)
+        stats = StreamingStats()
+        for ranges in range(1, 10000):
+            values = [max(1, int(rnd.lognormvariate(5, spread))) for _ in range(100)]
+            monitor.add_range(len(values), sum(values))
+            stats.merge(stats_of(values))
+            if monitor.converged(stats):
+                return ranges
+    homogeneous = ranges_until_converged(0.05)
+    skewed = ranges_until_converged(1.0)
+    # Sketch compaction is random, the percentile intervals of alike rows may need a few more ranges
+    assert homogeneous <= 2 * ConvergenceMonitor(0.02).min_ranges
+    assert skewed > 10 * homogeneous
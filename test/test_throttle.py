@@ -0,0 +1,57 @@
+from row_estimator_for_apache_cassandra.throttle import AIMDController, RateLimiter
+
+def run_round(controller, latency_ms):
+    changed = None
+    for _ in range(max(controller.round_size, controller.limit)):
+        changed = controller.record(latency_ms) or changed
+    return changed
+
+def test_aimd_grows_while_latency_is_low():
+    controller = AIMDController(target_p99_ms=50, max_limit=16, round_size=10)
+    assert controller.limit == 1
+    run_round(controller, 10)
+    run_round(controller, 10)
+    assert controller.limit == 4
+    for _ in range(5):
+        run_round(controller, 10)
+    assert controller.limit == 16
+
+def test_aimd_cuts_on_slow_rounds_and_then_grows_additively():
+    controller = AIMDController(target_p99_ms=50, max_limit=64, round_size=10)
+    for _ in range(4):
+        run_round(controller, 10)
+    assert controller.limit == 16
+    assert run_round(controller, 80) == 8
+    run_round(controller, 10)
+    assert controller.limit == 9
+
+def test_aimd_cuts_at_once_on_overload():
+    controller = AIMDController(target_p99_ms=50, max_limit=64, min_limit=2, round_size=10)
+    for _ in range(3):
+        run_round(controller, 10)
+    assert controller.overloaded() == 8
+    assert controller.overloaded() == 4
+    assert controller.overloaded() == 2
+    assert controller.overloaded() == 2
+
+def test_aimd_cuts_once_per_window_of_errors():
+    now = [0.0]
+    controller = AIMDController(target_p99_ms=50, max_limit=64, min_limit=2, round_size=10, clock=lambda: now[0])
+    for _ in range(3):
+        run_round(controller, 10)
+    # Eight queries in flight since t=1 time out together at t=2
+    now[0] = 2.0
+    assert [controller.overloaded(sent_at=1.0) for _ in range(8)] == [8] + [None] * 7
+    assert controller.limit == 8 and controller.decreases == 1
+    # A query sent after the cut cuts again
+    now[0] = 3.0
+    assert controller.overloaded(sent_at=2.5) == 4
+
+def test_rate_limiter_delays_after_a_burst():
+    now = [0.0]
+    limiter = RateLimiter(100, clock=lambda: now[0])
+    assert limiter.delay() == 0
+    limiter.consume(150)
+    assert limiter.delay() == 0.5
+    now[0] = 0.5
+    assert limiter.delay() == 0
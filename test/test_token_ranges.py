@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from fake_cluster import FakeCluster, attach
+from row_estimator_for_apache_cassandra.estimator import Estimator, MIN_TOKEN, MAX_TOKEN, plan_weighted_ranges
+
+def test_token_ranges_strata_cover_the_ring():
+    estimator = Estimator('127.0.0.1', 9042, sampling='stratified', strata=64, seed=7)
+    ranges = estimator.get_token_ranges()
+    assert len(ranges) == 64
+    assert ranges[-1][1] == MAX_TOKEN
+    width = (MAX_TOKEN - MIN_TOKEN) // 64
+    for i, (start, end) in enumerate(ranges):
+        low = MIN_TOKEN + i * width
+        assert low <= start < end
+        assert end == MAX_TOKEN or end == low + width
+
+def test_token_ranges_strata_are_repeatable_with_a_seed():
+    first = Estimator('127.0.0.1', 9042, sampling='stratified', strata=16, seed=1).get_token_ranges()
+    second = Estimator('127.0.0.1', 9042, sampling='stratified', strata=16, seed=1).get_token_ranges()
+    assert first == second
+
+def test_token_ranges_weighted_budget_follows_the_data():
+    estimates = [(0, 1000, 10, 100), (1000, 2000, 100000, 100), (2000, 3000, 0, 0), (3000, 4000, 1000, 100)]
+    plan, projection = plan_weighted_ranges(estimates, row_budget=10000, rows_per_request=1000, rnd=random.Random(1))
+    assert projection == {'partitions': 101010, 'bytes': 10101000}
+    dense = [(r, limit) for r, limit in plan if 1000 <= r[0] and r[1] <= 2000]
+    # 99% of the bytes: ten queries over equal slices of the range
+    assert len(dense) == 10 and dense[0][0] == (1000, 1100) and dense[-1][0][1] == 2000
+    assert all(limit == 991 for _, limit in dense)
+    # The two small ranges hold 1% of the bytes, at most one of them is read, with a full query
+    small = [(r, limit) for r, limit in plan if r[0] < 1000 or r[0] >= 2000]
+    assert len(small) <= 1 and all(limit == 1000 for _, limit in small)
+
+def test_token_ranges_weighted_small_ranges_keep_their_expected_share():
+    estimates = [(i * 10, i * 10 + 10, 1, 100) for i in range(1000)]
+    plan, _ = plan_weighted_ranges(estimates, row_budget=50000, rows_per_request=1000, rnd=random.Random(2))
+    # 50 queries worth of rows spread over 1000 equal ranges
+    assert len(plan) == 50
+
+def test_token_ranges_ring_covers_every_gap():
+    cluster = FakeCluster([], nodes=3, vnodes=8, seed=5)
+    ring = [t.value for t in cluster.metadata.token_map.ring]
+    estimator = attach(Estimator('127.0.0.1', 9042, token_step=1), cluster)
+    ranges = estimator.get_token_ranges()
+    assert len(ranges) == len(ring) + 1
+    # Adjacent ranges between consecutive tokens, then the wrap-around range as two queries
+    assert ranges[:-2] == list(zip(ring, ring[1:]))
+    assert ranges[-2:] == [(ring[-1], MAX_TOKEN), (MIN_TOKEN, ring[0])]
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]) if b[0] != MIN_TOKEN)
+    # Every third range, the wrap-around one only when the step lands on the last token
+    stepped = attach(Estimator('127.0.0.1', 9042, token_step=3), cluster).get_token_ranges()
+    assert stepped == [(ring[i], ring[i + 1]) for i in range(0, 24, 3)]
+    stepped = attach(Estimator('127.0.0.1', 9042, token_step=23), cluster).get_token_ranges()
+    assert stepped == [(ring[0], ring[1]), (ring[-1], MAX_TOKEN), (MIN_TOKEN, ring[0])]
+
+def test_token_ranges_weighted_plan_cannot_be_sharded():
+    estimator = Estimator('127.0.0.1', 9042, sampling='weighted', shard=(1, 2))
+    with pytest.raises(ValueError):
+        estimator.get_sample_ranges()